@@ -1,24 +1,52 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Request
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from models.feedback import FeedbackRequest, FeedbackResponse, ErrorResponse, FeedbackHistoryResponse, DashboardStats
-from models.database import get_db, FeedbackHistory, create_tables
-from services.llm_service import LLMService
+from fastapi import APIRouter, HTTPException, status, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.feedback import FeedbackRequest, FeedbackResponse, FeedbackHistoryResponse, DashboardStats
+from models.database import get_db, FeedbackHistory, FeedbackStats
+from services.llm_service import get_llm_service
 from services.validation import input_validator
+from services.feedback_writer import feedback_writer
+import asyncio
+import hashlib
 import logging
+import os
 import time
-from datetime import datetime, timedelta
-from sqlalchemy import func, desc
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select, tuple_
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Ensure database tables exist
-create_tables()
+# Dashboard data tolerates a few seconds of staleness; polling clients share one computation
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", 5))
+_dashboard_cache = {"expires_at": 0.0, "payload": None, "etag": None}
+_dashboard_lock = asyncio.Lock()
+
+
+# Columns serialized by FeedbackHistoryResponse; selecting them directly skips ORM entity loading
+HISTORY_COLUMNS = (
+    FeedbackHistory.id,
+    FeedbackHistory.feedback_text,
+    FeedbackHistory.category,
+    FeedbackHistory.urgency_score,
+    FeedbackHistory.confidence_score,
+    FeedbackHistory.processing_time,
+    FeedbackHistory.llm_provider,
+    FeedbackHistory.created_at,
+    FeedbackHistory.user_ip
+)
 
 
 def get_client_ip(request: Request) -> str:
     """Get client IP from request"""
+    # Resolved once per request by RateLimitMiddleware
+    client_ip = getattr(request.state, "client_ip", None)
+    if client_ip:
+        return client_ip
+    
+    # Fallback for requests that did not pass through the middleware
     forwarded_for = request.headers.get("X-Forwarded-For")
     if forwarded_for:
         return forwarded_for.split(",")[0].strip()
@@ -26,7 +54,7 @@ def get_client_ip(request: Request) -> str:
 
 
 @router.post("/triage", response_model=FeedbackResponse)
-async def triage_feedback(request: FeedbackRequest, http_request: Request, db: Session = Depends(get_db)):
+async def triage_feedback(request: FeedbackRequest, http_request: Request):
     """
     Analyze user feedback and classify it by category and urgency.
     
@@ -36,8 +64,8 @@ async def triage_feedback(request: FeedbackRequest, http_request: Request, db: S
     client_ip = get_client_ip(http_request)
     
     try:
-        # Enhanced input validation
-        validation_result = input_validator.validate_feedback_text(request.text)
+        # Enhanced input validation (CPU-bound regex work, kept off the event loop)
+        validation_result = await run_in_threadpool(input_validator.validate_feedback_text, request.text)
         
         if not validation_result["valid"]:
             logger.warning(f"Invalid input from {client_ip}: {validation_result['errors']}")
@@ -59,14 +87,14 @@ async def triage_feedback(request: FeedbackRequest, http_request: Request, db: S
         # Use cleaned text for analysis
         cleaned_text = validation_result["cleaned_text"]
         
-        # Initialize LLM service
-        llm_service = LLMService()
+        # Shared LLM service (configuration errors surface here as ValueError)
+        llm_service = get_llm_service()
         
         # Check if user manually selected a category
-        if request.category and request.category.strip():
+        if request.category:
             # User manually selected category - use it and only analyze urgency
-            logger.info(f"Using manually selected category: {request.category}")
-            analysis = await llm_service.analyze_feedback_with_category(cleaned_text, request.category)
+            logger.info(f"Using manually selected category: {request.category.value}")
+            analysis = await llm_service.analyze_feedback_with_category(cleaned_text, request.category.value)
         else:
             # Let LLM analyze and determine category automatically
             logger.info("LLM analyzing category automatically")
@@ -75,22 +103,19 @@ async def triage_feedback(request: FeedbackRequest, http_request: Request, db: S
         # Calculate processing time
         processing_time = time.time() - start_time
         
-        # Store in database
-        feedback_record = FeedbackHistory(
-            feedback_text=cleaned_text,
-            category=analysis.category.value,
-            urgency_score=analysis.urgency_score.value,
-            confidence_score=analysis.confidence_score,
-            processing_time=processing_time,
-            llm_provider=llm_service.get_provider_name(),
-            user_ip=client_ip
-        )
-        
-        db.add(feedback_record)
-        db.commit()
-        db.refresh(feedback_record)
+        # Store in database (batched with concurrent requests; returns once committed)
+        feedback_id = await feedback_writer.submit({
+            "feedback_text": cleaned_text,
+            "category": analysis.category.value,
+            "urgency_score": analysis.urgency_score.value,
+            "confidence_score": analysis.confidence_score,
+            "processing_time": processing_time,
+            # Classifier answers keep their own marker so retraining can leave them out
+            "llm_provider": analysis.source or llm_service.get_provider_name(),
+            "user_ip": client_ip
+        })
         
-        logger.info(f"Feedback analyzed: ID={feedback_record.id}, Category={analysis.category.value}, Urgency={analysis.urgency_score.value}, Time={processing_time:.2f}s")
+        logger.info(f"Feedback analyzed: ID={feedback_id}, Category={analysis.category.value}, Urgency={analysis.urgency_score.value}, Time={processing_time:.2f}s")
         
         # Return response
         return FeedbackResponse(
@@ -133,61 +158,68 @@ async def health_check():
     return {"status": "healthy", "service": "feedback-triage-api"}
 
 
+async def _build_dashboard_stats(db: AsyncSession) -> DashboardStats:
+    """Compute dashboard statistics from the database"""
+    # Aggregates come from the feedback_stats rollup: at most one row per
+    # (category, urgency) pair, so this stays O(1) as history grows
+    stats_rows = (await db.execute(select(FeedbackStats))).scalars().all()
+    
+    total_feedback = 0
+    total_time = 0.0
+    categories = {}
+    urgency_distribution = {}
+    for stat in stats_rows:
+        total_feedback += stat.cnt
+        total_time += stat.sum_time
+        categories[stat.category] = categories.get(stat.category, 0) + stat.cnt
+        urgency_key = str(stat.urgency_score)
+        urgency_distribution[urgency_key] = urgency_distribution.get(urgency_key, 0) + stat.cnt
+    
+    avg_time_result = total_time / total_feedback if total_feedback else None
+    avg_processing_time = float(avg_time_result) if avg_time_result else None
+    
+    # Get recent feedback (last 10)
+    recent_feedback = (await db.execute(
+        select(*HISTORY_COLUMNS).order_by(
+            FeedbackHistory.created_at.desc()
+        ).limit(10)
+    )).mappings()
+    
+    # Rows were validated on the way in; model_construct skips re-validating them
+    recent_feedback_list = [
+        FeedbackHistoryResponse.model_construct(**record) for record in recent_feedback
+    ]
+    
+    return DashboardStats(
+        total_feedback=total_feedback,
+        categories=categories,
+        urgency_distribution=urgency_distribution,
+        avg_processing_time=avg_processing_time,
+        recent_feedback=recent_feedback_list
+    )
+
+
 @router.get("/dashboard", response_model=DashboardStats)
-async def get_dashboard(db: Session = Depends(get_db)):
+async def get_dashboard(http_request: Request, db: AsyncSession = Depends(get_db)):
     """
     Get dashboard statistics and recent feedback history.
+    
+    The serialized payload is cached for DASHBOARD_CACHE_TTL seconds and tagged
+    with an ETag, so polling clients get 304 Not Modified while it is unchanged.
     """
     try:
-        # Get total feedback count
-        total_feedback = db.query(FeedbackHistory).count()
-        
-        # Get category distribution
-        category_stats = db.query(
-            FeedbackHistory.category,
-            func.count(FeedbackHistory.id).label('count')
-        ).group_by(FeedbackHistory.category).all()
-        
-        categories = {stat.category: stat.count for stat in category_stats}
-        
-        # Get urgency distribution
-        urgency_stats = db.query(
-            FeedbackHistory.urgency_score,
-            func.count(FeedbackHistory.id).label('count')
-        ).group_by(FeedbackHistory.urgency_score).all()
-        
-        urgency_distribution = {str(stat.urgency_score): stat.count for stat in urgency_stats}
-        
-        # Get average processing time
-        avg_time_result = db.query(func.avg(FeedbackHistory.processing_time)).scalar()
-        avg_processing_time = float(avg_time_result) if avg_time_result else None
-        
-        # Get recent feedback (last 10)
-        recent_feedback = db.query(FeedbackHistory).order_by(
-            desc(FeedbackHistory.created_at)
-        ).limit(10).all()
-        
-        recent_feedback_list = [
-            FeedbackHistoryResponse(
-                id=record.id,
-                feedback_text=record.feedback_text,
-                category=record.category,
-                urgency_score=record.urgency_score,
-                confidence_score=record.confidence_score,
-                processing_time=record.processing_time,
-                llm_provider=record.llm_provider,
-                created_at=record.created_at,
-                user_ip=record.user_ip
-            ) for record in recent_feedback
-        ]
-        
-        return DashboardStats(
-            total_feedback=total_feedback,
-            categories=categories,
-            urgency_distribution=urgency_distribution,
-            avg_processing_time=avg_processing_time,
-            recent_feedback=recent_feedback_list
-        )
+        if _dashboard_cache["expires_at"] <= time.monotonic():
+            async with _dashboard_lock:
+                # Another request may have refreshed the cache while we waited
+                if _dashboard_cache["expires_at"] <= time.monotonic():
+                    stats = await _build_dashboard_stats(db)
+                    payload = stats.model_dump_json().encode()
+                    _dashboard_cache["payload"] = payload
+                    _dashboard_cache["etag"] = f'W/"{hashlib.sha256(payload).hexdigest()}"'
+                    _dashboard_cache["expires_at"] = time.monotonic() + DASHBOARD_CACHE_TTL
+        
+        payload = _dashboard_cache["payload"]
+        etag = _dashboard_cache["etag"]
         
     except Exception as e:
         logger.error(f"Dashboard error: {e}")
@@ -195,57 +227,70 @@ async def get_dashboard(db: Session = Depends(get_db)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to fetch dashboard data"
         )
+    
+    if_none_match = http_request.headers.get("If-None-Match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    return Response(content=payload, media_type="application/json", headers={"ETag": etag})
 
 
 @router.get("/feedback/history")
 async def get_feedback_history(
     limit: int = 20, 
-    offset: int = 0,
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
     category: str = None,
     urgency: int = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get paginated feedback history with optional filtering.
+    
+    Pages are keyset-based: pass the previous page's next_cursor as before/before_id.
     """
     try:
-        query = db.query(FeedbackHistory)
+        query = select(*HISTORY_COLUMNS)
         
         # Apply filters
         if category:
-            query = query.filter(FeedbackHistory.category == category)
+            query = query.where(FeedbackHistory.category == category)
         if urgency:
-            query = query.filter(FeedbackHistory.urgency_score == urgency)
-        
-        # Get total count for pagination
-        total = query.count()
-        
-        # Apply pagination
-        feedback_records = query.order_by(
-            desc(FeedbackHistory.created_at)
-        ).offset(offset).limit(limit).all()
-        
-        feedback_list = [
-            FeedbackHistoryResponse(
-                id=record.id,
-                feedback_text=record.feedback_text,
-                category=record.category,
-                urgency_score=record.urgency_score,
-                confidence_score=record.confidence_score,
-                processing_time=record.processing_time,
-                llm_provider=record.llm_provider,
-                created_at=record.created_at,
-                user_ip=record.user_ip
-            ) for record in feedback_records
-        ]
-        
-        return {
+            query = query.where(FeedbackHistory.urgency_score == urgency)
+        
+        # Keyset pagination: resume strictly after the cursor row, so a page costs
+        # an index seek plus `limit` rows no matter how deep it is
+        if before is not None and before_id is not None:
+            query = query.where(
+                tuple_(FeedbackHistory.created_at, FeedbackHistory.id) < tuple_(before, before_id)
+            )
+        elif before is not None:
+            query = query.where(FeedbackHistory.created_at < before)
+        
+        # Fetch one extra row to learn whether another page exists
+        feedback_records = (await db.execute(
+            query.order_by(
+                FeedbackHistory.created_at.desc(),
+                FeedbackHistory.id.desc()
+            ).limit(limit + 1)
+        )).mappings().all()
+        
+        has_more = len(feedback_records) > limit
+        # Rows already have the FeedbackHistoryResponse shape and orjson encodes
+        # them (datetimes included) directly, so skip building models per row
+        feedback_list = [dict(record) for record in feedback_records[:limit]]
+        
+        next_cursor = None
+        if has_more and feedback_list:
+            last = feedback_list[-1]
+            next_cursor = {"before": last["created_at"], "before_id": last["id"]}
+        
+        return ORJSONResponse({
             "feedback": feedback_list,
-            "total": total,
             "limit": limit,
-            "offset": offset,
-            "has_more": offset + limit < total
-        }
+            "has_more": has_more,
+            "next_cursor": next_cursor
+        })
         
     except Exception as e:
         logger.error(f"History fetch error: {e}")
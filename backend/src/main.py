@@ -1,8 +1,13 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from middleware.rate_limit import RateLimitMiddleware
 from api.routes import router
+from models.database import create_tables
+from services.feedback_writer import feedback_writer
+from services.llm_service import close_http_client, get_llm_service
 import logging
 import os
 from dotenv import load_dotenv
@@ -14,11 +19,33 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Ensure database tables exist before serving (sync DDL, kept off the event loop)
+    await run_in_threadpool(create_tables)
+    
+    # Batched feedback writes run for the lifetime of the app
+    feedback_writer.start()
+    
+    # Optionally open the provider connection up front so the first triage does not pay for it;
+    # off by default because each worker start then sends a real, billed completion
+    if os.getenv("LLM_WARMUP", "false").lower() == "true":
+        try:
+            await get_llm_service().warmup()
+        except Exception as e:
+            logger.warning(f"LLM warmup failed: {e}")
+    
+    yield
+    await feedback_writer.stop()
+    await close_http_client()
+
 # Create FastAPI app
 app = FastAPI(
     title="Feedback Triage API",
     description="AI-powered feedback classification and urgency ranking system",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -40,7 +67,7 @@ app.include_router(router, prefix="/api")
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logger.error(f"Global exception: {exc}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "Internal Server Error",
@@ -61,4 +88,5 @@ async def root():
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # "auto" picks uvloop where it is installed and falls back to asyncio elsewhere
+    uvicorn.run(app, host="0.0.0.0", port=port, loop="auto")
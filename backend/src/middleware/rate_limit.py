@@ -1,11 +1,19 @@
 
 import time
+import logging
 from collections import defaultdict, deque
-from fastapi import Request, HTTPException, status
+from fastapi import Request, status
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
+import redis.asyncio as redis
 import os
 
+logger = logging.getLogger(__name__)
+
+# After a Redis error, limits stay in-process for this many seconds before Redis is tried again
+REDIS_RETRY_INTERVAL = 5
+
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
     def __init__(self, app, calls: int = None, period: int = None):
@@ -14,24 +22,38 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         self.calls = calls or int(os.getenv("RATE_LIMIT_CALLS", 60))
         self.period = period or int(os.getenv("RATE_LIMIT_PERIOD", 60))
         
-        # Store request timestamps for each IP
-        self.requests = defaultdict(deque)
+        # Shared counters in Redis keep the limit consistent across workers. Short socket
+        # timeouts make an unreachable host fall back to in-process limits quickly
+        redis_url = os.getenv("REDIS_URL")
+        redis_timeout = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", 0.25))
+        self.redis = redis.from_url(
+            redis_url, socket_connect_timeout=redis_timeout, socket_timeout=redis_timeout
+        ) if redis_url else None
+        self._redis_retry_at = 0.0
+        
+        # In-process fallback: ring buffer of the last `calls` accepted timestamps per IP
+        self.requests = defaultdict(lambda: deque(maxlen=self.calls))
+        self._last_sweep = time.time()
     
     async def dispatch(self, request: Request, call_next):
-        # Get client IP
+        # Get client IP once and share it with the route handlers
         client_ip = self._get_client_ip(request)
+        request.state.client_ip = client_ip
         
         # Check if this endpoint should be rate limited
         if self._should_rate_limit(request.url.path):
-            if not self._is_allowed(client_ip):
-                raise HTTPException(
+            if not await self._is_allowed(client_ip):
+                # Returned rather than raised: exceptions from middleware bypass
+                # FastAPI's HTTPException handling and would surface as a 500
+                return ORJSONResponse(
                     status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail={
+                    headers={"Retry-After": str(self.period)},
+                    content={"detail": {
                         "error": "Rate limit exceeded",
                         "message": f"Too many requests. Limit: {self.calls} requests per {self.period} seconds",
                         "status_code": 429,
                         "retry_after": self.period
-                    }
+                    }}
                 )
         
         response = await call_next(request)
@@ -58,37 +80,64 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         rate_limited_paths = ["/api/triage", "/api/dashboard"]
         return any(path.startswith(p) for p in rate_limited_paths)
     
-    def _is_allowed(self, client_ip: str) -> bool:
+    async def _is_allowed(self, client_ip: str) -> bool:
         """Check if the client is allowed to make a request"""
-        now = time.time()
+        if self.redis is not None and time.time() >= self._redis_retry_at:
+            try:
+                return await self._is_allowed_redis(client_ip)
+            except redis.RedisError as e:
+                logger.warning(f"Rate limit store unavailable, using in-process limits: {e}")
+                self._redis_retry_at = time.time() + REDIS_RETRY_INTERVAL
+        
+        return self._is_allowed_local(client_ip)
+    
+    async def _is_allowed_redis(self, client_ip: str) -> bool:
+        """Fixed-window counter in Redis: one INCR per request, keys expire with their window"""
+        window = int(time.time() // self.period)
+        key = f"ratelimit:{client_ip}:{window}"
         
-        # Clean old requests (older than the period)
-        while (self.requests[client_ip] and 
-               now - self.requests[client_ip][0] > self.period):
-            self.requests[client_ip].popleft()
+        pipe = self.redis.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, self.period)
+        count, _ = await pipe.execute()
+        return count <= self.calls
+    
+    def _is_allowed_local(self, client_ip: str) -> bool:
+        """Sliding-window check against the in-process timestamp store"""
+        now = time.time()
+        if now - self._last_sweep > self.period:
+            self._sweep(now)
         
-        # Check if under the limit
-        if len(self.requests[client_ip]) < self.calls:
-            # Add current request
-            self.requests[client_ip].append(now)
+        # The buffer holds at most `calls` entries, so the client is under the limit
+        # while it has spare capacity or its oldest entry has left the window;
+        # appending to a full buffer evicts that oldest entry
+        timestamps = self.requests[client_ip]
+        if len(timestamps) < self.calls or now - timestamps[0] > self.period:
+            timestamps.append(now)
             return True
         
         return False
     
+    def _sweep(self, now: float):
+        """Drop clients whose newest request has left the window"""
+        stale = [ip for ip, timestamps in self.requests.items()
+                 if not timestamps or now - timestamps[-1] > self.period]
+        for ip in stale:
+            del self.requests[ip]
+        self._last_sweep = now
+    
     def get_remaining_requests(self, client_ip: str) -> int:
         """Get the number of remaining requests for a client"""
         now = time.time()
+        timestamps = self.requests.get(client_ip, ())
+        in_window = sum(1 for t in timestamps if now - t <= self.period)
         
-        # Clean old requests
-        while (self.requests[client_ip] and 
-               now - self.requests[client_ip][0] > self.period):
-            self.requests[client_ip].popleft()
-        
-        return max(0, self.calls - len(self.requests[client_ip]))
+        return max(0, self.calls - in_window)
     
     def get_reset_time(self, client_ip: str) -> float:
         """Get the time when the rate limit resets for a client"""
-        if not self.requests[client_ip]:
+        timestamps = self.requests.get(client_ip)
+        if not timestamps:
             return time.time()
         
-        return self.requests[client_ip][0] + self.period
+        return timestamps[0] + self.period
@@ -1,9 +1,10 @@
 """
 Database models for feedback history storage
 """
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, inspect, select, func, text, true, Column, Integer, String, Text, DateTime, Float, Index
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from datetime import datetime
 import os
 
@@ -11,48 +12,171 @@ Base = declarative_base()
 
 class FeedbackHistory(Base):
     __tablename__ = "feedback_history"
+    __table_args__ = (
+        # Serves category/urgency filters ordered by recency; its prefix covers category alone
+        Index("ix_feedback_cat_urg_created", "category", "urgency_score", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     feedback_text = Column(Text, nullable=False)
     category = Column(String(50), nullable=False)
-    urgency_score = Column(Integer, nullable=False)
+    urgency_score = Column(Integer, nullable=False, index=True)
     confidence_score = Column(Float, nullable=True)
     processing_time = Column(Float, nullable=True)  # in seconds
     llm_provider = Column(String(20), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     user_ip = Column(String(45), nullable=True)  # For basic tracking
+
+
+# Newest-first listings read this index in order instead of sorting the table;
+# id breaks created_at ties so it also serves keyset pagination cursors
+Index("ix_feedback_history_created_at_id", FeedbackHistory.created_at.desc(), FeedbackHistory.id.desc())
+
+# Partial indexes for the hot dashboard slices: they only hold the matching rows,
+# so "latest critical" / "latest bugs" scans stay small on skewed data
+_CRITICAL_PREDICATE = text("urgency_score >= 4")
+_BUGS_PREDICATE = text("category = 'Bug Report'")
+Index(
+    "ix_feedback_critical", FeedbackHistory.created_at.desc(),
+    postgresql_where=_CRITICAL_PREDICATE, sqlite_where=_CRITICAL_PREDICATE
+)
+Index(
+    "ix_feedback_bugs", FeedbackHistory.created_at.desc(),
+    postgresql_where=_BUGS_PREDICATE, sqlite_where=_BUGS_PREDICATE
+)
+
+
+class FeedbackStats(Base):
+    """Dashboard rollup, kept current by the triage insert path"""
+    __tablename__ = "feedback_stats"
     
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "feedback_text": self.feedback_text,
-            "category": self.category,
-            "urgency_score": self.urgency_score,
-            "confidence_score": self.confidence_score,
-            "processing_time": self.processing_time,
-            "llm_provider": self.llm_provider,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "user_ip": self.user_ip
-        }
+    category = Column(String(50), primary_key=True)
+    urgency_score = Column(Integer, primary_key=True)
+    cnt = Column(Integer, nullable=False, default=0)
+    sum_time = Column(Float, nullable=False, default=0.0)  # in seconds
 
 # Database configuration with SQLite fallback
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./feedback_triage.db")
 
+# Supported DATABASE_URL schemes: (sync scheme for DDL and scripts, asyncio scheme for the app).
+# postgres:// is the Heroku-style alias that SQLAlchemy no longer accepts
+_SCHEMES = {
+    "sqlite": ("sqlite", "sqlite+aiosqlite"),
+    "sqlite+pysqlite": ("sqlite+pysqlite", "sqlite+aiosqlite"),
+    "sqlite+aiosqlite": ("sqlite", "sqlite+aiosqlite"),
+    "postgres": ("postgresql", "postgresql+asyncpg"),
+    "postgresql": ("postgresql", "postgresql+asyncpg"),
+    "postgresql+psycopg2": ("postgresql+psycopg2", "postgresql+asyncpg"),
+    "postgresql+asyncpg": ("postgresql", "postgresql+asyncpg"),
+}
+
+def _database_url(url: str, use_asyncio: bool) -> str:
+    """Rewrite a database URL onto the sync or asyncio driver for its backend"""
+    scheme, sep, rest = url.partition(":")
+    if scheme not in _SCHEMES:
+        raise ValueError(
+            f"Unsupported DATABASE_URL scheme '{scheme}'; use one of: {', '.join(_SCHEMES)}"
+        )
+    return _SCHEMES[scheme][use_asyncio] + sep + rest
+
+def _async_database_url(url: str) -> str:
+    """Map a database URL onto its asyncio driver"""
+    return _database_url(url, use_asyncio=True)
+
+def _sync_database_url(url: str) -> str:
+    """Map a database URL onto its sync driver"""
+    return _database_url(url, use_asyncio=False)
+
+# For code that runs outside the event loop: table creation and offline scripts
+SYNC_DATABASE_URL = _sync_database_url(DATABASE_URL)
+
 # Create engine with appropriate configuration
 if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    engine = create_async_engine(_async_database_url(DATABASE_URL))
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets /dashboard read while /triage commits, and NORMAL sync skips the per-commit fsync
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
 else:
-    engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Sized for concurrent FastAPI workers; pre-ping and recycle drop stale server connections
+    engine = create_async_engine(
+        _async_database_url(DATABASE_URL),
+        pool_size=int(os.getenv("DB_POOL_SIZE", 20)),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", 30)),
+        pool_pre_ping=True,
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 3600))
+    )
+SessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
-def get_db():
+async def get_db():
     """Get database session"""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+# Dialects whose insert() supports ON CONFLICT, for the backends _SCHEMES accepts
+_UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+
+def _stats_insert():
+    """INSERT into feedback_stats with the dialect's ON CONFLICT support"""
+    dialect = _UPSERT_DIALECTS.get(engine.dialect.name)
+    if dialect is None:
+        raise ValueError(f"feedback_stats upserts are not supported on {engine.dialect.name}")
+    return dialect.insert(FeedbackStats)
+
+def feedback_stats_upsert(category: str, urgency_score: int, processing_time: float, count: int = 1):
+    """Build the statement that folds `count` new feedback records into feedback_stats"""
+    stmt = _stats_insert().values(
+        category=category,
+        urgency_score=urgency_score,
+        cnt=count,
+        sum_time=processing_time or 0.0
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[FeedbackStats.category, FeedbackStats.urgency_score],
+        set_={
+            "cnt": FeedbackStats.cnt + stmt.excluded.cnt,
+            "sum_time": FeedbackStats.sum_time + stmt.excluded.sum_time
+        }
+    )
 
 def create_tables():
     """Create database tables"""
-    Base.metadata.create_all(bind=engine)
+    # DDL goes through a short-lived sync engine so this can run outside an event loop
+    if DATABASE_URL.startswith("sqlite"):
+        ddl_engine = create_engine(SYNC_DATABASE_URL, connect_args={"check_same_thread": False})
+    else:
+        ddl_engine = create_engine(SYNC_DATABASE_URL)
+    try:
+        backfill_stats = not inspect(ddl_engine).has_table(FeedbackStats.__tablename__)
+        Base.metadata.create_all(bind=ddl_engine)
+        # create_all only builds indexes alongside new tables; add any missing ones
+        for index in FeedbackHistory.__table__.indexes:
+            index.create(bind=ddl_engine, checkfirst=True)
+        if backfill_stats:
+            # Seed the rollup from history recorded before it existed. Workers starting
+            # together may all get here, so rows another worker already seeded are skipped;
+            # SQLite needs the WHERE clause to parse INSERT ... SELECT ... ON CONFLICT
+            with ddl_engine.begin() as conn:
+                conn.execute(_stats_insert().from_select(
+                    ["category", "urgency_score", "cnt", "sum_time"],
+                    select(
+                        FeedbackHistory.category,
+                        FeedbackHistory.urgency_score,
+                        func.count(FeedbackHistory.id),
+                        func.coalesce(func.sum(FeedbackHistory.processing_time), 0.0)
+                    ).where(true()).group_by(FeedbackHistory.category, FeedbackHistory.urgency_score)
+                ).on_conflict_do_nothing())
+    finally:
+        ddl_engine.dispose()
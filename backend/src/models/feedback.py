@@ -1,6 +1,6 @@
 from enum import Enum
-from typing import Literal, Optional, List
-from pydantic import BaseModel, Field, validator
+from typing import Annotated, Optional, List, Union
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints
 from datetime import datetime
 
 
@@ -20,23 +20,14 @@ class UrgencyScore(int, Enum):
 
 
 class FeedbackRequest(BaseModel):
-    text: str = Field(..., max_length=1000, description="The feedback text to analyze")
-    category: Optional[str] = Field(None, description="User-selected category (optional)")
-    
-    @validator('text')
-    def validate_text(cls, v):
-        if not v.strip():
-            raise ValueError("Text cannot be empty")
-        return v.strip()
-    
-    @validator('category')
-    def validate_category(cls, v):
-        if v and v.strip():
-            # Validate that the category is one of the allowed values
-            valid_categories = [cat.value for cat in FeedbackCategory]
-            if v not in valid_categories:
-                raise ValueError(f"Invalid category. Must be one of: {valid_categories}")
-        return v
+    # Constraints run inside pydantic-core: strip, then reject empty or over-long text
+    text: Annotated[str, StringConstraints(strip_whitespace=True, min_length=1, max_length=1000)] = Field(
+        ..., description="The feedback text to analyze"
+    )
+    # An empty or whitespace-only string still means "no category selected"; it is stripped to ""
+    category: Optional[Union[FeedbackCategory, Annotated[str, StringConstraints(strip_whitespace=True, max_length=0)]]] = Field(
+        None, description="User-selected category (optional)"
+    )
 
 
 class FeedbackResponse(BaseModel):
@@ -56,9 +47,23 @@ class LLMResponse(BaseModel):
     urgency_score: UrgencyScore
     reasoning: str = Field(default="", description="Optional reasoning from the LLM")
     confidence_score: Optional[float] = Field(default=None, description="Confidence score 0-1")
+    # Set when the analysis did not come from the configured LLM provider; stored as llm_provider
+    source: Optional[str] = Field(default=None, description="Name of the non-LLM source of the analysis")
+
+
+class PartialLLMResponse(BaseModel):
+    # Fields are filled in as a streamed reply arrives; complete marks the final, full analysis
+    category: Optional[FeedbackCategory] = None
+    urgency_score: Optional[UrgencyScore] = None
+    reasoning: str = ""
+    confidence_score: Optional[float] = None
+    complete: bool = False
 
 
 class FeedbackHistoryResponse(BaseModel):
+    # Built straight from FeedbackHistory rows
+    model_config = ConfigDict(from_attributes=True)
+    
     id: int
     feedback_text: str
     category: FeedbackCategory
@@ -71,6 +76,8 @@ class FeedbackHistoryResponse(BaseModel):
 
 
 class DashboardStats(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     total_feedback: int
     categories: dict
     urgency_distribution: dict
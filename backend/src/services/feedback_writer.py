@@ -0,0 +1,140 @@
+"""
+Batched persistence for triaged feedback
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, Any, List, Tuple
+from sqlalchemy import insert
+from models.database import SessionLocal, FeedbackHistory, feedback_stats_upsert
+
+logger = logging.getLogger(__name__)
+
+# Built once at import; SQLAlchemy's compiled cache then reuses its SQL for every batch
+_INSERT_STMT = insert(FeedbackHistory.__table__).returning(
+    FeedbackHistory.__table__.c.id, sort_by_parameter_order=True
+)
+
+# Queued by stop(); _run writes everything ahead of it and then exits
+_STOP = object()
+
+
+class FeedbackWriter:
+    """Coalesces feedback inserts from concurrent requests into multi-row writes"""
+
+    def __init__(self, max_batch: int = None, flush_interval: float = None):
+        # Default: flush every 50 ms or as soon as 100 records are waiting
+        self.max_batch = max_batch or int(os.getenv("DB_WRITE_BATCH_SIZE", 100))
+        self.flush_interval = flush_interval or float(os.getenv("DB_WRITE_FLUSH_INTERVAL", 0.05))
+
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+    def start(self):
+        """Start the background flush task on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush task and write anything still queued"""
+        if self._task is None:
+            return
+
+        # The task is asked to finish rather than cancelled, so a batch it has
+        # already taken off the queue is still written
+        if not self._task.done():
+            self._queue.put_nowait(_STOP)
+            await self._task
+        self._task = None
+
+        # Records submitted while the task was finishing
+        pending = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                pending.append(item)
+        if pending:
+            await self._flush(pending)
+
+    async def submit(self, record: Dict[str, Any]) -> int:
+        """Queue a feedback_history row and wait until it is committed; returns its id"""
+        self.start()
+        future = self._loop.create_future()
+        self._queue.put_nowait((record, future))
+        return await future
+
+    async def _run(self):
+        batch = []
+        stopping = False
+        try:
+            while not stopping:
+                item = await self._queue.get()
+                if item is _STOP:
+                    return
+                batch = [item]
+                deadline = self._loop.time() + self.flush_interval
+
+                while len(batch) < self.max_batch:
+                    timeout = deadline - self._loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+                await self._flush(batch)
+                batch = []
+        except asyncio.CancelledError:
+            # Cancelled from outside (e.g. loop shutdown): the batch in hand may not be
+            # committed, so its callers get an error instead of waiting forever
+            error = RuntimeError("Feedback writer stopped before the record was written")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            raise
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        records = [record for record, _ in batch]
+
+        # Fold the batch into one rollup increment per (category, urgency) pair
+        stats = {}
+        for record in records:
+            key = (record["category"], record["urgency_score"])
+            count, total_time = stats.get(key, (0, 0.0))
+            stats[key] = (count + 1, total_time + (record.get("processing_time") or 0.0))
+
+        try:
+            async with SessionLocal() as db:
+                # One multi-row INSERT ... RETURNING for the whole batch
+                result = await db.execute(_INSERT_STMT, records)
+                ids = result.scalars().all()
+
+                for (category, urgency_score), (count, total_time) in stats.items():
+                    await db.execute(feedback_stats_upsert(category, urgency_score, total_time, count))
+
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} feedback records: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), record_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(record_id)
+
+
+# Global writer instance
+feedback_writer = FeedbackWriter()
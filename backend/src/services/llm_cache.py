@@ -0,0 +1,94 @@
+"""
+Exact-match cache for LLM feedback analysis
+"""
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple
+import orjson
+import redis.asyncio as redis
+from models.feedback import LLMResponse, FeedbackCategory, UrgencyScore
+
+logger = logging.getLogger(__name__)
+
+# Cached analyses are stored as plain primitives: (category, urgency_score, reasoning, confidence_score)
+CachedAnalysis = Tuple[str, int, str, Optional[float]]
+
+
+class LLMResponseCache:
+    """In-process LRU of recent analyses, optionally shared across workers through Redis"""
+
+    def __init__(self, maxsize: int = None, ttl: int = None, redis_url: str = None):
+        # Default: keep 10k analyses in process and 24 h in Redis
+        self.maxsize = maxsize if maxsize is not None else int(os.getenv("LLM_CACHE_SIZE", 10000))
+        self.ttl = ttl or int(os.getenv("LLM_CACHE_TTL", 86400))
+
+        redis_url = redis_url or os.getenv("REDIS_URL")
+        self.redis = redis.from_url(redis_url) if redis_url else None
+
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(provider: str, model: str, category: Optional[str], text: str) -> str:
+        """Key an analysis by everything that can change the answer; case and outer whitespace do not"""
+        normalized = text.strip().lower()
+        digest = hashlib.blake2b(
+            f"{provider}\x00{model}\x00{category or ''}\x00{normalized}".encode(),
+            digest_size=16
+        ).hexdigest()
+        return f"llmcache:{digest}"
+
+    async def get(self, key: str) -> Optional[LLMResponse]:
+        """Return the cached analysis for key, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return self._to_response(entry)
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(key)
+            except redis.RedisError as e:
+                logger.warning(f"LLM cache store unavailable: {e}")
+                return None
+            if raw is not None:
+                entry = tuple(orjson.loads(raw))
+                self._remember(key, entry)
+                return self._to_response(entry)
+
+        return None
+
+    async def set(self, key: str, response: LLMResponse):
+        """Store an analysis locally and, when configured, in Redis"""
+        entry = (
+            response.category.value,
+            int(response.urgency_score),
+            response.reasoning,
+            response.confidence_score
+        )
+        self._remember(key, entry)
+
+        if self.redis is not None:
+            try:
+                await self.redis.setex(key, self.ttl, orjson.dumps(entry))
+            except redis.RedisError as e:
+                logger.warning(f"LLM cache store unavailable: {e}")
+
+    def _remember(self, key: str, entry: CachedAnalysis):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _to_response(entry: CachedAnalysis) -> LLMResponse:
+        category, urgency_score, reasoning, confidence_score = entry
+        return LLMResponse(
+            category=FeedbackCategory(category),
+            urgency_score=UrgencyScore(urgency_score),
+            reasoning=reasoning,
+            confidence_score=confidence_score
+        )
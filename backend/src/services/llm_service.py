@@ -1,212 +1,515 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
-import json
+from dataclasses import dataclass
+import asyncio
+import random
+import re
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 import httpx
+import orjson
 import os
-from models.feedback import LLMResponse, FeedbackCategory, UrgencyScore
+from models.feedback import LLMResponse, PartialLLMResponse, FeedbackCategory, UrgencyScore
+from services.llm_cache import LLMResponseCache
+from services.partial_json import PartialJSONObject
+from services.urgency_classifier import URGENCY_CLASSIFIER_SOURCE, load_urgency_classifier
+
+
+# Enum lookups for decoding replies
+_CAT_BY_VALUE = {c.value: c for c in FeedbackCategory}
+_URG_BY_VALUE = {u.value: u for u in UrgencyScore}
+
+# Reply shapes enforced through each provider's structured-output mode.
+# Strict JSON-schema mode needs every property required and no extras
+FEEDBACK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": [c.value for c in FeedbackCategory]},
+        "urgency_score": {"type": "integer", "enum": [u.value for u in UrgencyScore]},
+        "reasoning": {"type": "string"},
+        "confidence_score": {"type": "number"}
+    },
+    "required": ["category", "urgency_score", "reasoning", "confidence_score"],
+    "additionalProperties": False
+}
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {"analyses": {"type": "array", "items": FEEDBACK_SCHEMA}},
+    "required": ["analyses"],
+    "additionalProperties": False
+}
+
+# (name, JSON schema) pairs handed to LLMProvider._complete
+OutputSchema = Tuple[str, Dict[str, Any]]
+FEEDBACK_OUTPUT: OutputSchema = ("feedback", FEEDBACK_SCHEMA)
+BATCH_OUTPUT: OutputSchema = ("feedback_batch", BATCH_SCHEMA)
+
+# Worked examples for the OpenAI-style providers. Sent as one fixed system message so the
+# prefix is identical on every call and eligible for the provider's automatic prompt cache
+FEW_SHOT_SYSTEM = """You are a feedback analysis agent that returns only valid JSON.
+
+Examples:
+"I can't log in to my account, the password reset link is broken. I need to access my files urgently for a client meeting!" -> {"category": "Bug Report", "urgency_score": 4, "reasoning": "Login functionality is broken affecting user's ability to work with time pressure", "confidence_score": 0.95}
+"Could you add a dark mode feature? It would be great for late-night work sessions." -> {"category": "Feature Request", "urgency_score": 2, "reasoning": "Nice-to-have feature request without urgency", "confidence_score": 0.98}
+"The app is amazing! Thank you for all the improvements. The load time is so much faster now." -> {"category": "Praise/Positive Feedback", "urgency_score": 1, "reasoning": "Positive feedback expressing satisfaction", "confidence_score": 0.99}
+"How do I export my data to CSV? I checked the menu but couldn't find the option." -> {"category": "General Inquiry", "urgency_score": 2, "reasoning": "User question about existing functionality", "confidence_score": 0.92}
+"URGENT: The app crashes every time I try to save my work. I've lost 3 hours of progress!" -> {"category": "Bug Report", "urgency_score": 5, "reasoning": "Critical bug causing data loss with high user frustration", "confidence_score": 0.97}"""
+
+
+class _SharedHTTP:
+    """One pooled HTTP/2 client shared by all providers, so TLS setup is paid once per host"""
+    client: Optional[httpx.AsyncClient] = None
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    @classmethod
+    async def get(cls) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        # Pooled connections belong to the loop that opened them
+        if cls.client is None or cls.client.is_closed or cls._loop is not loop:
+            cls.client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=1000, max_keepalive_connections=200),
+                timeout=30.0
+            )
+            cls._loop = loop
+        return cls.client
+    
+    @classmethod
+    async def close(cls):
+        if cls.client is not None:
+            await cls.client.aclose()
+            cls.client = None
 
 
-class LLMProvider(ABC):
-    @abstractmethod
-    async def analyze_feedback(self, text: str) -> LLMResponse:
-        pass
-    
-    @abstractmethod
-    async def analyze_feedback_with_category(self, text: str, category: str) -> LLMResponse:
-        pass
+async def close_http_client():
+    """Close the shared provider HTTP client; called on app shutdown"""
+    await _SharedHTTP.close()
 
 
-class OpenAIProvider(LLMProvider):
-    def __init__(self, api_key: str, model: str = "gpt-4"):
-        self.api_key = api_key
-        self.model = model
-        self.base_url = "https://api.openai.com/v1"
-        
-    def _create_prompt(self, text: str) -> str:
-        return f"""
-You are a feedback analysis agent. Your job is to analyze user feedback and classify it into categories and urgency levels.
+async def _sse_events(response: httpx.Response) -> AsyncIterator[Any]:
+    """Decoded `data:` payloads of a server-sent event stream, up to [DONE]"""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[6:] if line.startswith("data: ") else line[5:]
+        if data == "[DONE]":
+            return
+        yield orjson.loads(data)
 
-CATEGORIES:
-1. Bug Report: Identifies a technical issue or something that is broken
-2. Feature Request: Suggests a new feature or enhancement
-3. Praise/Positive Feedback: Expresses satisfaction or appreciation
-4. General Inquiry: Questions or comments that don't fit other categories
 
-URGENCY SCALE (1-5):
-1: Not Urgent - Minor issues, general questions, positive feedback
-2: Low - Small improvements, non-critical issues
-3: Medium - Moderate impact, affects some users
-4: High - Significant impact, affects many users, time-sensitive
-5: Critical - Severe issues, blocks core functionality, urgent business need
-
-EXAMPLES FOR REFERENCE:
-
-Example 1:
-Feedback: "I can't log in to my account, the password reset link is broken. I need to access my files urgently for a client meeting!"
-Analysis: {{
-  "category": "Bug Report",
-  "urgency_score": 4,
-  "reasoning": "Login functionality is broken affecting user's ability to work with time pressure",
-  "confidence_score": 0.95
-}}
+# Transient failures worth another attempt: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
 
-Example 2:
-Feedback: "Could you add a dark mode feature? It would be great for late-night work sessions."
-Analysis: {{
-  "category": "Feature Request", 
-  "urgency_score": 2,
-  "reasoning": "Nice-to-have feature request without urgency",
-  "confidence_score": 0.98
-}}
 
-Example 3:
-Feedback: "The app is amazing! Thank you for all the improvements. The load time is so much faster now."
-Analysis: {{
-  "category": "Praise/Positive Feedback",
-  "urgency_score": 1,
-  "reasoning": "Positive feedback expressing satisfaction",
-  "confidence_score": 0.99
-}}
+class RetryableHTTPError(Exception):
+    """A transient provider error, carrying the server's Retry-After delay when it sent one"""
+    
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_SECONDS = re.compile(r"\d+(?:\.\d+)?")
+_DURATION = re.compile(r"(?:\d+(?:\.\d+)?(?:ms|s|m|h))+")
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_delay(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After or rate-limit reset header.
+
+    Accepts plain seconds ("2"), Go-style durations ("6m0s", "20ms"), RFC 3339
+    timestamps (Anthropic's resets) and HTTP dates; anything else gives None.
+    """
+    if not value:
+        return None
+    try:
+        if _SECONDS.fullmatch(value):
+            return float(value)
+        if _DURATION.fullmatch(value):
+            return sum(float(amount) * _UNIT_SECONDS[unit] for amount, unit in _DURATION_PART.findall(value))
+        try:
+            when = datetime.fromisoformat(value)
+        except ValueError:
+            when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+# (remaining, reset) header pairs reported by OpenAI-style endpoints and by Anthropic
+_RATE_LIMIT_HEADERS = (
+    ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+    ("x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+    ("anthropic-ratelimit-requests-remaining", "anthropic-ratelimit-requests-reset"),
+    ("anthropic-ratelimit-tokens-remaining", "anthropic-ratelimit-tokens-reset"),
+)
+
+
+class RateLimiter:
+    """Paces outbound calls to stay under a requests-per-minute and tokens-per-minute budget"""
+    
+    def __init__(self, rpm: int, tpm: int):
+        # 0 leaves that dimension unlimited
+        self.rpm = rpm
+        self.tpm = tpm
+        self._sent = deque()  # (timestamp, estimated tokens) for calls in the last minute
+        self._tokens = 0
+        self._paused_until = 0.0  # set from the provider's own rate-limit headers
+        self._lock = asyncio.Lock()
+    
+    def observe(self, headers: httpx.Headers):
+        """Hold back every call until the server's window resets once it reports a budget exhausted"""
+        delay = _parse_delay(headers.get("retry-after"))
+        for remaining, reset in _RATE_LIMIT_HEADERS:
+            if headers.get(remaining) == "0":
+                reset_in = _parse_delay(headers.get(reset))
+                if reset_in is not None:
+                    delay = max(delay or 0.0, reset_in)
+        if delay:
+            # Capped at one window so a far-off or garbled reset cannot stall the service
+            self._paused_until = max(self._paused_until, time.monotonic() + min(delay, 60.0))
+    
+    async def acquire(self, tokens: int):
+        """Wait until a call costing `tokens` fits in the sliding one-minute window"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                
+                while self._sent and now - self._sent[0][0] >= 60:
+                    _, sent_tokens = self._sent.popleft()
+                    self._tokens -= sent_tokens
+                
+                under_rpm = not self.rpm or len(self._sent) < self.rpm
+                under_tpm = not self.tpm or self._tokens + tokens <= self.tpm
+                # An empty window always admits, so one oversized call cannot wedge the limiter
+                if (under_rpm and under_tpm) or not self._sent:
+                    self._sent.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                
+                await asyncio.sleep(60 - (now - self._sent[0][0]))
 
-Example 4:
-Feedback: "How do I export my data to CSV? I checked the menu but couldn't find the option."
-Analysis: {{
-  "category": "General Inquiry",
-  "urgency_score": 2,
-  "reasoning": "User question about existing functionality",
-  "confidence_score": 0.92
-}}
 
-Example 5:
-Feedback: "URGENT: The app crashes every time I try to save my work. I've lost 3 hours of progress!"
-Analysis: {{
-  "category": "Bug Report",
-  "urgency_score": 5,
-  "reasoning": "Critical bug causing data loss with high user frustration",
-  "confidence_score": 0.97
-}}
+class LLMProvider(ABC):
+    # Subclasses define these; prompts are the static prefix plus the feedback text
+    _prompt_prefix: str
+    _category_prompt_template: str
+    _category_prompt_prefix: Dict[str, str]
+    
+    # Fed with every response's rate-limit headers when set (LLMService shares its limiter)
+    rate_limiter: Optional[RateLimiter] = None
+    
+    def _check_response(self, response: httpx.Response, api_name: str):
+        """Report rate-limit headers, then raise on an error status; transient ones are retryable"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.observe(response.headers)
+        if response.status_code != 200:
+            message = f"{api_name} API error: {response.status_code} - {response.text}"
+            if response.status_code in RETRYABLE_STATUS:
+                raise RetryableHTTPError(message, _parse_delay(response.headers.get("retry-after")))
+            raise Exception(message)
+    
+    def _create_prompt(self, text: str) -> str:
+        # The rubric is sent byte-identical on every call, so providers can reuse their prefix cache
+        return self._prompt_prefix + text
+    
+    def _create_category_prompt(self, text: str, category: str) -> str:
+        # {category} is filled in once per category, then reused
+        prefix = self._category_prompt_prefix.get(category)
+        if prefix is None:
+            prefix = self._category_prompt_template.format(category=category)
+            self._category_prompt_prefix[category] = prefix
+        return prefix + text
+    
+    # Shared by every provider: several items per request, answered as one JSON object
+    _batch_prompt_header = """
+You are a feedback analysis agent. Classify each numbered feedback item below.
 
-Now analyze this feedback and respond with ONLY valid JSON including confidence_score (0-1):
+CATEGORIES: Bug Report, Feature Request, Praise/Positive Feedback, General Inquiry
+URGENCY (1-5): 1=Not Urgent, 2=Low, 3=Medium, 4=High, 5=Critical
 
-{{
-  "category": "one of the four categories above",
-  "urgency_score": 1-5,
-  "reasoning": "brief explanation of your decision",
-  "confidence_score": 0.0-1.0
-}}
+Respond with ONLY valid JSON whose "analyses" array holds one object per item, in the same order:
+{"analyses": [{"category": "one of the four categories above", "urgency_score": 1-5, "reasoning": "brief explanation", "confidence_score": 0.0-1.0}]}
 
-Feedback to analyze:
-{text}
+Feedback items:
 """
-
-    async def analyze_feedback(self, text: str) -> LLMResponse:
-        prompt = self._create_prompt(text)
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+    
+    def _create_batch_prompt(self, texts: List[str]) -> str:
+        # Items are JSON-quoted so multi-line feedback cannot blur item boundaries
+        return self._batch_prompt_header + "\n".join(
+            f"{number}. {orjson.dumps(text).decode()}" for number, text in enumerate(texts, 1)
+        )
+    
+    @abstractmethod
+    async def _complete(self, prompt: str, max_tokens: int = 120, output: OutputSchema = FEEDBACK_OUTPUT) -> Any:
+        """Send one prompt and return the model's decoded JSON reply, constrained to `output`"""
+        pass
+    
+    @abstractmethod
+    def _stream(self, prompt: str, max_tokens: int = 120, output: OutputSchema = FEEDBACK_OUTPUT) -> AsyncIterator[str]:
+        """Send one prompt and yield the JSON reply text piece by piece as it is generated"""
+        pass
+    
+    @staticmethod
+    def _to_response(parsed: Dict[str, Any], category: Optional[str] = None) -> LLMResponse:
+        category = category or parsed["category"]
+        urgency_score = parsed["urgency_score"]
+        reasoning = parsed.get("reasoning", "")
+        confidence_score = parsed.get("confidence_score")
         
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": "You are a feedback analysis agent that returns only valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.1,
-            "max_tokens": 300
-        }
+        # Well-formed replies are assembled from lookup tables without revalidation. Only exact
+        # types qualify (no bools, no floats for the score) so the result is what validation would give
+        if (
+            category in _CAT_BY_VALUE
+            and type(urgency_score) is int and urgency_score in _URG_BY_VALUE
+            and type(reasoning) is str
+            and (confidence_score is None or (type(confidence_score) is float and 0.0 <= confidence_score <= 1.0))
+        ):
+            return LLMResponse.model_construct(
+                category=_CAT_BY_VALUE[category],
+                urgency_score=_URG_BY_VALUE[urgency_score],
+                reasoning=reasoning,
+                confidence_score=confidence_score
+            )
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload
+        # Anything else goes through full validation, which raises on bad values
+        return LLMResponse(
+            category=FeedbackCategory(category),
+            urgency_score=UrgencyScore(urgency_score),
+            reasoning=reasoning,
+            confidence_score=confidence_score
+        )
+    
+    async def warmup(self):
+        """Prime DNS, TLS, the pooled connection and the model with a 1-token request"""
+        try:
+            await self._complete("ping", max_tokens=1)
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+            # A 1-token reply is never a full analysis; only the round-trip matters
+            pass
+    
+    async def analyze_feedback(self, text: str) -> LLMResponse:
+        try:
+            return self._to_response(await self._complete(self._create_prompt(text)))
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            raise Exception(f"Failed to parse LLM response: {e}")
+    
+    async def analyze_feedback_with_category(self, text: str, category: str) -> LLMResponse:
+        # Only urgency is analyzed; the user-selected category is kept as given
+        try:
+            return self._to_response(await self._complete(self._create_category_prompt(text, category)), category)
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            raise Exception(f"Failed to parse LLM response: {e}")
+    
+    @staticmethod
+    def _to_partial(parser: PartialJSONObject) -> PartialLLMResponse:
+        values = parser.values
+        reasoning = values.get("reasoning")
+        if reasoning is None and parser.partial_key == "reasoning":
+            reasoning = parser.partial_value
+        return PartialLLMResponse.model_construct(
+            category=_CAT_BY_VALUE.get(values.get("category")),
+            urgency_score=_URG_BY_VALUE.get(values.get("urgency_score")),
+            reasoning=reasoning if isinstance(reasoning, str) else "",
+            confidence_score=values.get("confidence_score"),
+            complete=False
+        )
+    
+    async def analyze_feedback_stream(self, text: str) -> AsyncIterator[PartialLLMResponse]:
+        """Analyze feedback over a streamed reply, yielding each time a field arrives or grows.
+
+        Category and urgency come first in the reply, so callers can act on them while the
+        reasoning is still being generated. The last item is the full analysis with complete=True.
+        """
+        parser = PartialJSONObject()
+        seen = (0, 0)
+        try:
+            async for chunk in self._stream(self._create_prompt(text)):
+                parser.feed(chunk)
+                # Compare lengths so the reasoning is only joined when a partial is yielded
+                growing = parser.partial_length if parser.partial_key == "reasoning" else 0
+                progress = (len(parser.values), growing)
+                if progress != seen:
+                    seen = progress
+                    yield self._to_partial(parser)
+            result = self._to_response(parser.values)
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            raise Exception(f"Failed to parse LLM response: {e}")
+        yield PartialLLMResponse.model_construct(**dict(result), complete=True)
+    
+    async def analyze_feedback_batch(self, texts: List[str]) -> List[LLMResponse]:
+        """Analyze several feedback items with a single request"""
+        try:
+            # Roughly 80 output tokens per analysis
+            parsed = await self._complete(
+                self._create_batch_prompt(texts), max_tokens=80 * len(texts), output=BATCH_OUTPUT
             )
-            
-            if response.status_code != 200:
-                raise Exception(f"OpenAI API error: {response.status_code} - {response.text}")
-            
-            result = response.json()
-            content = result["choices"][0]["message"]["content"].strip()
-            
-            try:
-                parsed = json.loads(content)
-                return LLMResponse(
-                    category=FeedbackCategory(parsed["category"]),
-                    urgency_score=UrgencyScore(parsed["urgency_score"]),
-                    reasoning=parsed.get("reasoning", ""),
-                    confidence_score=parsed.get("confidence_score")
-                )
-            except (json.JSONDecodeError, KeyError, ValueError) as e:
-                raise Exception(f"Failed to parse LLM response: {e}")
+            analyses = parsed["analyses"] if isinstance(parsed, dict) else parsed
+            if not isinstance(analyses, list) or len(analyses) != len(texts):
+                raise ValueError(f"expected {len(texts)} analyses")
+            return [self._to_response(item) for item in analyses]
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            raise Exception(f"Failed to parse LLM response: {e}")
+
+
+@dataclass(frozen=True)
+class OpenAILikeConfig:
+    """What differs between OpenAI-compatible chat-completions endpoints"""
+    api_name: str  # used in error messages
+    url: str  # may reference {endpoint}, {deployment} and {api_version}
+    auth_header: str
+    auth_format: str  # formatted with the API key
+    include_model_in_body: bool = True
+    system_prompt: str = FEW_SHOT_SYSTEM
+    # Strict json_schema response_format; endpoints without it get plain JSON mode
+    strict_schema: bool = True
+
+
+OPENAI_COMPATIBLE_CONFIGS = {
+    "openai": OpenAILikeConfig(
+        api_name="OpenAI",
+        url="https://api.openai.com/v1/chat/completions",
+        auth_header="Authorization",
+        auth_format="Bearer {}"
+    ),
+    "azure_openai": OpenAILikeConfig(
+        api_name="Azure OpenAI",
+        url="{endpoint}/openai/deployments/{deployment}/chat/completions?api-version={api_version}",
+        auth_header="api-key",
+        auth_format="{}",
+        include_model_in_body=False
+    ),
+    "groq": OpenAILikeConfig(
+        api_name="Groq",
+        url="https://api.groq.com/openai/v1/chat/completions",
+        auth_header="Authorization",
+        auth_format="Bearer {}",
+        system_prompt="You are a feedback analysis agent that returns only valid JSON.",
+        strict_schema=False
+    ),
+    # Self-hosted OpenAI-compatible server such as llama.cpp's llama-server or vLLM;
+    # both enforce json_schema response formats through grammar-constrained decoding
+    "local": OpenAILikeConfig(
+        api_name="Local LLM",
+        url="{base_url}/chat/completions",
+        auth_header="Authorization",
+        auth_format="Bearer {}"
+    )
+}
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Any chat-completions endpoint with the OpenAI request and response shape"""
+    
+    # Replies are schema-constrained, so the prompt only names the fields
+    _prompt_prefix = """
+You are a feedback analysis agent. Classify user feedback into categories and urgency levels.
 
-    async def analyze_feedback_with_category(self, text: str, category: str) -> LLMResponse:
-        # For OpenAI provider - analyze only urgency with given category
-        prompt = f"""
+CATEGORIES:
+1. Bug Report: Technical issue or something that is broken
+2. Feature Request: New feature or enhancement
+3. Praise/Positive Feedback: Satisfaction or appreciation
+4. General Inquiry: Questions or comments that fit no other category
+
+URGENCY (1-5): 1=Not Urgent, 2=Low, 3=Medium (affects some users), 4=High (affects many users, time-sensitive), 5=Critical (blocks core functionality)
+
+Give the category, urgency_score, a brief reasoning and confidence_score (0.0-1.0).
+
+Feedback to analyze:
+"""
+
+    _category_prompt_template = """
 You are analyzing feedback urgency. The category "{category}" has been manually selected.
 Analyze ONLY the urgency level (1-5) for this feedback.
 
 URGENCY (1-5): 1=Not Urgent, 2=Low, 3=Medium, 4=High, 5=Critical
 
-Respond with ONLY valid JSON:
-{{
-  "category": "{category}",
-  "urgency_score": 1-5,
-  "reasoning": "brief explanation",
-  "confidence_score": 0.0-1.0
-}}
+Keep category "{category}" and give urgency_score, a brief reasoning and confidence_score (0.0-1.0).
 
-Feedback: {text}
-"""
+Feedback: """
+
+    def __init__(self, config: OpenAILikeConfig, api_key: str, model: str, **url_params: str):
+        self.config = config
+        self.api_key = api_key
+        self.model = model
+        self.url = config.url.format(**url_params)
+        self._category_prompt_prefix: Dict[str, str] = {}
         
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
+        # Everything but the prompt and token budget is fixed per provider, so it is built once
+        # here and shared by reference; orjson serializes it without copying
+        self._headers = {
+            config.auth_header: config.auth_format.format(api_key),
             "Content-Type": "application/json"
         }
-        
+        self._system_msg = {"role": "system", "content": config.system_prompt}
+        self._response_formats: Dict[str, Dict[str, Any]] = {}
+
+    def _response_format(self, output: OutputSchema) -> Dict[str, Any]:
+        name, schema = output
+        response_format = self._response_formats.get(name)
+        if response_format is None:
+            if self.config.strict_schema:
+                response_format = {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+            else:
+                # JSON mode guarantees a parseable object; the prompt spells out its shape
+                response_format = {"type": "json_object"}
+            self._response_formats[name] = response_format
+        return response_format
+
+    def _payload(self, prompt: str, max_tokens: int, output: OutputSchema) -> Dict[str, Any]:
         payload = {
-            "model": self.model,
             "messages": [
-                {"role": "system", "content": "You are a feedback analysis agent that returns only valid JSON."},
+                self._system_msg,
                 {"role": "user", "content": prompt}
             ],
             "temperature": 0.1,
-            "max_tokens": 300
+            "max_tokens": max_tokens
         }
+        if self.config.include_model_in_body:
+            payload["model"] = self.model
+        payload["response_format"] = self._response_format(output)
+        return payload
+    
+    async def _complete(self, prompt: str, max_tokens: int = 120, output: OutputSchema = FEEDBACK_OUTPUT) -> Any:
+        payload = self._payload(prompt, max_tokens, output)
+        client = await _SharedHTTP.get()
+        response = await client.post(self.url, headers=self._headers, content=orjson.dumps(payload))
+        self._check_response(response, self.config.api_name)
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload
-            )
-            
+        result = orjson.loads(response.content)
+        return orjson.loads(result["choices"][0]["message"]["content"])
+    
+    async def _stream(self, prompt: str, max_tokens: int = 120, output: OutputSchema = FEEDBACK_OUTPUT) -> AsyncIterator[str]:
+        payload = self._payload(prompt, max_tokens, output)
+        payload["stream"] = True
+        client = await _SharedHTTP.get()
+        async with client.stream("POST", self.url, headers=self._headers, content=orjson.dumps(payload)) as response:
             if response.status_code != 200:
-                raise Exception(f"OpenAI API error: {response.status_code} - {response.text}")
-            
-            result = response.json()
-            content = result["choices"][0]["message"]["content"].strip()
+                await response.aread()
+            self._check_response(response, self.config.api_name)
             
-            try:
-                parsed = json.loads(content)
-                return LLMResponse(
-                    category=FeedbackCategory(category),
-                    urgency_score=UrgencyScore(parsed["urgency_score"]),
-                    reasoning=parsed.get("reasoning", ""),
-                    confidence_score=parsed.get("confidence_score")
-                )
-            except (json.JSONDecodeError, KeyError, ValueError) as e:
-                raise Exception(f"Failed to parse LLM response: {e}")
+            async for event in _sse_events(response):
+                for choice in event.get("choices", ()):
+                    content = choice.get("delta", {}).get("content")
+                    if content:
+                        yield content
+
+
+class OpenAIProvider(OpenAICompatibleProvider):
+    def __init__(self, api_key: str, model: str = "gpt-4o"):
+        super().__init__(OPENAI_COMPATIBLE_CONFIGS["openai"], api_key, model)
+
 
 class AnthropicProvider(LLMProvider):
-    def __init__(self, api_key: str, model: str = "claude-3-sonnet-20240229"):
-        self.api_key = api_key
-        self.model = model
-        self.base_url = "https://api.anthropic.com"
-        
-    def _create_prompt(self, text: str) -> str:
-        return f"""
+    # The reply arrives as forced tool input, so the prompt only names the fields
+    _prompt_prefix = """
 You are a feedback analysis agent. Analyze user feedback and classify it.
 
 CATEGORIES:
@@ -224,270 +527,97 @@ EXAMPLES:
 - "App is amazing!" → Praise/Positive Feedback, urgency 1, confidence 0.99
 - "How to export data?" → General Inquiry, urgency 2, confidence 0.92
 
-Respond with ONLY valid JSON:
+Record the category, urgency_score, a brief reasoning and confidence_score (0.0-1.0).
 
-{{
-  "category": "one of the four categories above",
-  "urgency_score": 1-5,
-  "reasoning": "brief explanation",
-  "confidence_score": 0.0-1.0
-}}
+Feedback: """
 
-Feedback: {text}
-"""
+    _category_prompt_template = OpenAICompatibleProvider._category_prompt_template
 
-    async def analyze_feedback(self, text: str) -> LLMResponse:
-        prompt = self._create_prompt(text)
+    def __init__(self, api_key: str, model: str = "claude-3-sonnet-20240229"):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = "https://api.anthropic.com"
+        self._category_prompt_prefix: Dict[str, str] = {}
         
-        headers = {
-            "x-api-key": self.api_key,
+        # Fixed per provider, so built once and shared by reference
+        self.url = f"{self.base_url}/v1/messages"
+        self._headers = {
+            "x-api-key": api_key,
             "Content-Type": "application/json",
             "anthropic-version": "2023-06-01"
         }
-        
-        payload = {
-            "model": self.model,
-            "max_tokens": 300,
-            "temperature": 0.1,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        }
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.base_url}/v1/messages",
-                headers=headers,
-                json=payload
+        self._tools: Dict[str, Tuple[List[Dict[str, Any]], Dict[str, str]]] = {}
+
+    def _tool(self, output: OutputSchema) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        # (tools, tool_choice) forcing the reply through a tool whose input is the schema
+        name, schema = output
+        tool = self._tools.get(name)
+        if tool is None:
+            tool_name = f"emit_{name}"
+            tool = (
+                [{"name": tool_name, "description": "Record the feedback analysis", "input_schema": schema}],
+                {"type": "tool", "name": tool_name}
             )
-            
-            if response.status_code != 200:
-                raise Exception(f"Anthropic API error: {response.status_code} - {response.text}")
-            
-            result = response.json()
-            content = result["content"][0]["text"].strip()
-            
-            try:
-                parsed = json.loads(content)
-                return LLMResponse(
-                    category=FeedbackCategory(parsed["category"]),
-                    urgency_score=UrgencyScore(parsed["urgency_score"]),
-                    reasoning=parsed.get("reasoning", ""),
-                    confidence_score=parsed.get("confidence_score")
-                )
-            except (json.JSONDecodeError, KeyError, ValueError) as e:
-                raise Exception(f"Failed to parse LLM response: {e}")
+            self._tools[name] = tool
+        return tool
 
-    async def analyze_feedback_with_category(self, text: str, category: str) -> LLMResponse:
-        # For Anthropic provider - analyze only urgency with given category
-        prompt = f"""
-You are analyzing feedback urgency. The category "{category}" has been manually selected.
-Analyze ONLY the urgency level (1-5) for this feedback.
-
-URGENCY (1-5): 1=Not Urgent, 2=Low, 3=Medium, 4=High, 5=Critical
-
-Respond with ONLY valid JSON:
-{{
-  "category": "{category}",
-  "urgency_score": 1-5,
-  "reasoning": "brief explanation",
-  "confidence_score": 0.0-1.0
-}}
-
-Feedback: {text}
-"""
-        
-        headers = {
-            "x-api-key": self.api_key,
-            "Content-Type": "application/json",
-            "anthropic-version": "2023-06-01"
-        }
-        
-        payload = {
+    def _payload(self, prompt: str, max_tokens: int, output: OutputSchema) -> Dict[str, Any]:
+        tools, tool_choice = self._tool(output)
+        return {
             "model": self.model,
-            "max_tokens": 300,
+            "max_tokens": max_tokens,
             "temperature": 0.1,
             "messages": [
                 {"role": "user", "content": prompt}
-            ]
+            ],
+            "tools": tools,
+            "tool_choice": tool_choice
         }
+    
+    async def _complete(self, prompt: str, max_tokens: int = 120, output: OutputSchema = FEEDBACK_OUTPUT) -> Any:
+        payload = self._payload(prompt, max_tokens, output)
+        client = await _SharedHTTP.get()
+        response = await client.post(self.url, headers=self._headers, content=orjson.dumps(payload))
+        self._check_response(response, "Anthropic")
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.base_url}/v1/messages",
-                headers=headers,
-                json=payload
-            )
-            
+        result = orjson.loads(response.content)
+        for block in result["content"]:
+            if block.get("type") == "tool_use":
+                return block["input"]
+        raise KeyError("tool_use")
+    
+    async def _stream(self, prompt: str, max_tokens: int = 120, output: OutputSchema = FEEDBACK_OUTPUT) -> AsyncIterator[str]:
+        payload = self._payload(prompt, max_tokens, output)
+        payload["stream"] = True
+        client = await _SharedHTTP.get()
+        async with client.stream("POST", self.url, headers=self._headers, content=orjson.dumps(payload)) as response:
             if response.status_code != 200:
-                raise Exception(f"Anthropic API error: {response.status_code} - {response.text}")
+                await response.aread()
+            self._check_response(response, "Anthropic")
             
-            result = response.json()
-            content = result["content"][0]["text"].strip()
-            
-            try:
-                parsed = json.loads(content)
-                return LLMResponse(
-                    category=FeedbackCategory(category),
-                    urgency_score=UrgencyScore(parsed["urgency_score"]),
-                    reasoning=parsed.get("reasoning", ""),
-                    confidence_score=parsed.get("confidence_score")
-                )
-            except (json.JSONDecodeError, KeyError, ValueError) as e:
-                raise Exception(f"Failed to parse LLM response: {e}")
+            # The forced tool call's input arrives as input_json_delta fragments
+            async for event in _sse_events(response):
+                if event.get("type") == "content_block_delta":
+                    delta = event["delta"]
+                    if delta.get("type") == "input_json_delta" and delta.get("partial_json"):
+                        yield delta["partial_json"]
 
-class AzureOpenAIProvider(LLMProvider):
-    def __init__(self, api_key: str, endpoint: str, deployment: str, api_version: str = "2024-02-01"):
-        self.api_key = api_key
+
+class AzureOpenAIProvider(OpenAICompatibleProvider):
+    def __init__(self, api_key: str, endpoint: str, deployment: str, api_version: str = "2024-10-21"):
         self.endpoint = endpoint.rstrip('/')
         self.deployment = deployment
         self.api_version = api_version
-        
-    def _create_prompt(self, text: str) -> str:
-        return f"""
-You are a feedback analysis agent. Your job is to analyze user feedback and classify it into categories and urgency levels.
-
-CATEGORIES:
-1. Bug Report: Identifies a technical issue or something that is broken
-2. Feature Request: Suggests a new feature or enhancement
-3. Praise/Positive Feedback: Expresses satisfaction or appreciation
-4. General Inquiry: Questions or comments that don't fit other categories
-
-URGENCY SCALE (1-5):
-1: Not Urgent - Minor issues, general questions, positive feedback
-2: Low - Small improvements, non-critical issues
-3: Medium - Moderate impact, affects some users
-4: High - Significant impact, affects many users, time-sensitive
-5: Critical - Severe issues, blocks core functionality, urgent business need
-
-EXAMPLES:
-- "Can't login, urgent meeting!" → Bug Report, urgency 4, confidence 0.95
-- "Add dark mode feature" → Feature Request, urgency 2, confidence 0.98
-- "Love the new interface!" → Praise/Positive Feedback, urgency 1, confidence 0.99
-
-Analyze this feedback and respond with ONLY valid JSON:
-
-{{
-  "category": "one of the four categories above",
-  "urgency_score": 1-5,
-  "reasoning": "brief explanation of your decision",
-  "confidence_score": 0.0-1.0
-}}
+        # The deployment stands in for the model name; it travels in the URL, not the body
+        super().__init__(
+            OPENAI_COMPATIBLE_CONFIGS["azure_openai"], api_key, deployment,
+            endpoint=self.endpoint, deployment=deployment, api_version=api_version
+        )
 
-Feedback to analyze:
-{text}
-"""
 
-    async def analyze_feedback(self, text: str) -> LLMResponse:
-        prompt = self._create_prompt(text)
-        
-        headers = {
-            "api-key": self.api_key,
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "messages": [
-                {"role": "system", "content": "You are a feedback analysis agent that returns only valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.1,
-            "max_tokens": 300
-        }
-        
-        url = f"{self.endpoint}/openai/deployments/{self.deployment}/chat/completions?api-version={self.api_version}"
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, headers=headers, json=payload)
-            
-            if response.status_code != 200:
-                raise Exception(f"Azure OpenAI API error: {response.status_code} - {response.text}")
-            
-            result = response.json()
-            content = result["choices"][0]["message"]["content"].strip()
-            
-            try:
-                parsed = json.loads(content)
-                return LLMResponse(
-                    category=FeedbackCategory(parsed["category"]),
-                    urgency_score=UrgencyScore(parsed["urgency_score"]),
-                    reasoning=parsed.get("reasoning", ""),
-                    confidence_score=parsed.get("confidence_score")
-                )
-            except (json.JSONDecodeError, KeyError, ValueError) as e:
-                raise Exception(f"Failed to parse LLM response: {e}")
-
-    async def analyze_feedback_with_category(self, text: str, category: str) -> LLMResponse:
-        """Analyze feedback urgency with user-provided category"""
-        prompt = f"""
-You are a feedback analysis agent. The user has manually selected the category "{category}" for their feedback.
-Your job is to analyze ONLY the urgency level (1-5) for this feedback.
-
-URGENCY SCALE (1-5):
-1: Not Urgent - Minor issues, general questions, positive feedback
-2: Low - Small improvements, non-critical issues
-3: Medium - Moderate impact, affects some users
-4: High - Significant impact, affects many users, time-sensitive
-5: Critical - Severe issues, blocks core functionality, urgent business need
-
-Analyze this feedback and respond with ONLY valid JSON:
-
-{{
-  "category": "{category}",
-  "urgency_score": 1-5,
-  "reasoning": "brief explanation of urgency level",
-  "confidence_score": 0.0-1.0
-}}
-
-Feedback to analyze:
-{text}
-"""
-        
-        headers = {
-            "api-key": self.api_key,
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "messages": [
-                {"role": "system", "content": "You are a feedback analysis agent that returns only valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.1,
-            "max_tokens": 300
-        }
-        
-        url = f"{self.endpoint}/openai/deployments/{self.deployment}/chat/completions?api-version={self.api_version}"
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, headers=headers, json=payload)
-            
-            if response.status_code != 200:
-                raise Exception(f"Azure OpenAI API error: {response.status_code} - {response.text}")
-            
-            result = response.json()
-            content = result["choices"][0]["message"]["content"].strip()
-            
-            try:
-                parsed = json.loads(content)
-                return LLMResponse(
-                    category=FeedbackCategory(category),  # Use the user-selected category
-                    urgency_score=UrgencyScore(parsed["urgency_score"]),
-                    reasoning=parsed.get("reasoning", ""),
-                    confidence_score=parsed.get("confidence_score")
-                )
-            except (json.JSONDecodeError, KeyError, ValueError) as e:
-                raise Exception(f"Failed to parse LLM response: {e}")
-
-
-class GroqProvider(LLMProvider):
-    def __init__(self, api_key: str, model: str = "llama3-8b-8192"):
-        self.api_key = api_key
-        self.model = model
-        self.base_url = "https://api.groq.com/openai/v1"
-        
-    def _create_prompt(self, text: str) -> str:
-        return f"""
+class GroqProvider(OpenAICompatibleProvider):
+    # Groq's JSON mode has no schema, so its prompts keep the JSON template
+    _prompt_prefix = """
 You are a feedback analysis agent. Classify user feedback into categories and urgency levels.
 
 CATEGORIES:
@@ -505,61 +635,16 @@ EXAMPLES:
 
 Respond with ONLY valid JSON:
 
-{{
+{
   "category": "one of the four categories above",
   "urgency_score": 1-5,
   "reasoning": "brief explanation",
   "confidence_score": 0.0-1.0
-}}
+}
 
-Feedback: {text}
-"""
+Feedback: """
 
-    async def analyze_feedback(self, text: str) -> LLMResponse:
-        prompt = self._create_prompt(text)
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": "You are a feedback analysis agent that returns only valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.1,
-            "max_tokens": 300
-        }
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Groq API error: {response.status_code} - {response.text}")
-            
-            result = response.json()
-            content = result["choices"][0]["message"]["content"].strip()
-            
-            try:
-                parsed = json.loads(content)
-                return LLMResponse(
-                    category=FeedbackCategory(parsed["category"]),
-                    urgency_score=UrgencyScore(parsed["urgency_score"]),
-                    reasoning=parsed.get("reasoning", ""),
-                    confidence_score=parsed.get("confidence_score")
-                )
-            except (json.JSONDecodeError, KeyError, ValueError) as e:
-                raise Exception(f"Failed to parse LLM response: {e}")
-
-    async def analyze_feedback_with_category(self, text: str, category: str) -> LLMResponse:
-        # For Groq provider - analyze only urgency with given category
-        prompt = f"""
+    _category_prompt_template = """
 You are analyzing feedback urgency. The category "{category}" has been manually selected.
 Analyze ONLY the urgency level (1-5) for this feedback.
 
@@ -573,60 +658,57 @@ Respond with ONLY valid JSON:
   "confidence_score": 0.0-1.0
 }}
 
-Feedback: {text}
-"""
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": "You are a feedback analysis agent that returns only valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.1,
-            "max_tokens": 300
-        }
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Groq API error: {response.status_code} - {response.text}")
-            
-            result = response.json()
-            content = result["choices"][0]["message"]["content"].strip()
-            
-            try:
-                parsed = json.loads(content)
-                return LLMResponse(
-                    category=FeedbackCategory(category),
-                    urgency_score=UrgencyScore(parsed["urgency_score"]),
-                    reasoning=parsed.get("reasoning", ""),
-                    confidence_score=parsed.get("confidence_score")
-                )
-            except (json.JSONDecodeError, KeyError, ValueError) as e:
-                raise Exception(f"Failed to parse LLM response: {e}")
+Feedback: """
+
+    def __init__(self, api_key: str, model: str = "llama3-8b-8192"):
+        super().__init__(OPENAI_COMPATIBLE_CONFIGS["groq"], api_key, model)
+
+
+class LocalLLMProvider(OpenAICompatibleProvider):
+    def __init__(self, base_url: str = "http://localhost:8080/v1", model: str = "local", api_key: str = ""):
+        # Local servers usually run without a key; the header is sent either way
+        super().__init__(OPENAI_COMPATIBLE_CONFIGS["local"], api_key, model, base_url=base_url.rstrip('/'))
+
 
 class LLMService:
     def __init__(self):
-        self.provider = self._create_provider()
+        self.provider = self._create_provider(os.getenv("DEFAULT_LLM_PROVIDER", "openai"))
+        # Repeat submissions are answered from cache instead of another API round-trip
+        self.cache = LLMResponseCache()
+        # Items packed into each analyze_feedback_batch request
+        self.batch_size = int(os.getenv("LLM_BATCH_SIZE", 10))
+        self._model_name = getattr(self.provider, "model", None) or getattr(self.provider, "deployment", "")
+        
+        # Bound in-flight provider calls and pace them under the account's limits
+        self._semaphore = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", 256)))
+        self.rate_limiter = RateLimiter(int(os.getenv("LLM_RPM", 0)), int(os.getenv("LLM_TPM", 0)))
+        self.provider.rate_limiter = self.rate_limiter
+        
+        # Optional second provider, asked again when the first answers with low confidence
+        # (typically a small local model backed by a remote one)
+        fallback_type = os.getenv("LLM_FALLBACK_PROVIDER")
+        self.fallback_provider = self._create_provider(fallback_type) if fallback_type else None
+        if self.fallback_provider is not None:
+            self.fallback_provider.rate_limiter = self.rate_limiter
+        self.fallback_threshold = float(os.getenv("LLM_FALLBACK_CONFIDENCE", 0.6))
+        
+        # Transient provider errors are retried with jittered exponential backoff
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", 4))
+        self.retry_max_wait = float(os.getenv("LLM_RETRY_MAX_WAIT", 30))
+        self.warmup_timeout = float(os.getenv("LLM_WARMUP_TIMEOUT", 5))
+        
+        # With the category given, a confident local model answers urgency without an API call
+        self.urgency_classifier = load_urgency_classifier()
+        self.urgency_threshold = float(os.getenv("URGENCY_CLASSIFIER_THRESHOLD", 0.7))
     
-    def _create_provider(self) -> LLMProvider:
-        provider_type = os.getenv("DEFAULT_LLM_PROVIDER", "openai").lower()
+    def _create_provider(self, provider_type: str) -> LLMProvider:
+        provider_type = provider_type.lower()
         
         if provider_type == "openai":
             api_key = os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY")
             if not api_key:
                 raise ValueError("LLM_API_KEY or OPENAI_API_KEY environment variable is required")
-            model = os.getenv("LLM_MODEL", "gpt-4")
+            model = os.getenv("LLM_MODEL", "gpt-4o")
             return OpenAIProvider(api_key, model)
             
         elif provider_type == "anthropic":
@@ -640,7 +722,7 @@ class LLMService:
             api_key = os.getenv("AZURE_OPENAI_API_KEY")
             endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
             deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-            api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01")
+            api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21")
             
             if not all([api_key, endpoint, deployment]):
                 raise ValueError("AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_DEPLOYMENT environment variables are required")
@@ -654,15 +736,187 @@ class LLMService:
             model = os.getenv("GROQ_MODEL", "llama3-8b-8192")
             return GroqProvider(api_key, model)
             
+        elif provider_type == "local":
+            base_url = os.getenv("LOCAL_LLM_URL", "http://localhost:8080/v1")
+            model = os.getenv("LOCAL_LLM_MODEL", "local")
+            return LocalLLMProvider(base_url, model, os.getenv("LOCAL_LLM_API_KEY", ""))
+            
         else:
             raise ValueError(f"Unsupported LLM provider: {provider_type}")
     
+    @staticmethod
+    def _estimate_tokens(texts: List[str]) -> int:
+        # Rubric prompt and reply, plus roughly four characters per token of feedback
+        return 1000 + sum(len(text) // 4 + 80 for text in texts)
+    
+    def _retry_delay(self, attempt: int, error: RetryableHTTPError) -> Optional[float]:
+        """Seconds to wait before retrying, or None when the server asks for longer than retry_max_wait"""
+        # 0.5 s doubling per attempt plus up to 1 s of jitter, but never sooner than the server asked
+        delay = min(self.retry_max_wait, 0.5 * 2 ** attempt + random.uniform(0, 1))
+        if error.retry_after is not None:
+            if error.retry_after > self.retry_max_wait:
+                # e.g. an exhausted daily quota: fail now rather than hold the request
+                return None
+            delay = max(delay, error.retry_after)
+        return delay
+    
+    async def _call_provider(self, estimated_tokens: int, call, *args):
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                await self.rate_limiter.acquire(estimated_tokens)
+                try:
+                    return await call(*args)
+                except RetryableHTTPError as e:
+                    delay = self._retry_delay(attempt, e)
+                    if attempt >= self.max_retries or delay is None:
+                        raise
+            # Back off without holding a concurrency slot
+            await asyncio.sleep(delay)
+            attempt += 1
+    
+    def _needs_fallback(self, result: LLMResponse) -> bool:
+        return (
+            self.fallback_provider is not None
+            and result.confidence_score is not None
+            and result.confidence_score < self.fallback_threshold
+        )
+    
+    async def warmup(self):
+        """Pay connection setup and provider cold-start before the first real request.
+
+        One attempt, bounded by warmup_timeout and never retried, so a slow or
+        rate-limited provider cannot hold up startup.
+        """
+        async def attempt():
+            async with self._semaphore:
+                await self.rate_limiter.acquire(1)
+                await self.provider.warmup()
+        
+        await asyncio.wait_for(attempt(), self.warmup_timeout)
+    
     async def analyze_feedback(self, text: str) -> LLMResponse:
-        return await self.provider.analyze_feedback(text)
+        key = self.cache.make_key(self.get_provider_name(), self._model_name, None, text)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        result = await self._call_provider(
+            self._estimate_tokens([text]), self.provider.analyze_feedback, text
+        )
+        if self._needs_fallback(result):
+            result = await self._call_provider(
+                self._estimate_tokens([text]), self.fallback_provider.analyze_feedback, text
+            )
+        await self.cache.set(key, result)
+        return result
+    
+    async def analyze_feedback_stream(self, text: str) -> AsyncIterator[PartialLLMResponse]:
+        """Analyze feedback, yielding partial results as the reply streams in; the last has complete=True"""
+        key = self.cache.make_key(self.get_provider_name(), self._model_name, None, text)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            yield PartialLLMResponse.model_construct(**dict(cached), complete=True)
+            return
+        
+        attempt = 0
+        while True:
+            started = False
+            # The concurrency slot is held until the stream ends or the caller stops reading
+            async with self._semaphore:
+                await self.rate_limiter.acquire(self._estimate_tokens([text]))
+                try:
+                    async for partial in self.provider.analyze_feedback_stream(text):
+                        started = True
+                        if partial.complete:
+                            await self.cache.set(key, LLMResponse.model_construct(
+                                category=partial.category,
+                                urgency_score=partial.urgency_score,
+                                reasoning=partial.reasoning,
+                                confidence_score=partial.confidence_score
+                            ))
+                        yield partial
+                    return
+                except RetryableHTTPError as e:
+                    # Once partial results have gone out, a restart would repeat them
+                    delay = self._retry_delay(attempt, e)
+                    if started or attempt >= self.max_retries or delay is None:
+                        raise
+            await asyncio.sleep(delay)
+            attempt += 1
     
     async def analyze_feedback_with_category(self, text: str, category: str) -> LLMResponse:
-        return await self.provider.analyze_feedback_with_category(text, category)
+        key = self.cache.make_key(self.get_provider_name(), self._model_name, category, text)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        if self.urgency_classifier is not None:
+            urgency_score, probability = self.urgency_classifier.predict(text, category)
+            if probability >= self.urgency_threshold:
+                return LLMResponse(
+                    category=FeedbackCategory(category),
+                    urgency_score=UrgencyScore(urgency_score),
+                    reasoning="Estimated by the local urgency classifier",
+                    confidence_score=probability,
+                    source=URGENCY_CLASSIFIER_SOURCE
+                )
+        
+        result = await self._call_provider(
+            self._estimate_tokens([text]), self.provider.analyze_feedback_with_category, text, category
+        )
+        if self._needs_fallback(result):
+            result = await self._call_provider(
+                self._estimate_tokens([text]), self.fallback_provider.analyze_feedback_with_category, text, category
+            )
+        await self.cache.set(key, result)
+        return result
+    
+    async def analyze_feedback_batch(self, texts: List[str]) -> List[LLMResponse]:
+        """Analyze many feedback items, sending uncached ones batch_size at a time in concurrent requests"""
+        provider_name = self.get_provider_name()
+        keys = [self.cache.make_key(provider_name, self._model_name, None, text) for text in texts]
+        results = [await self.cache.get(key) for key in keys]
+        
+        misses = [i for i, result in enumerate(results) if result is None]
+        chunks = [misses[i:i + self.batch_size] for i in range(0, len(misses), self.batch_size)]
+        chunk_texts = [[texts[i] for i in chunk] for chunk in chunks]
+        analyses = await asyncio.gather(*(
+            self._call_provider(self._estimate_tokens(batch), self.provider.analyze_feedback_batch, batch)
+            for batch in chunk_texts
+        ))
+        
+        for chunk, chunk_results in zip(chunks, analyses):
+            for i, result in zip(chunk, chunk_results):
+                results[i] = result
+        
+        # Low-confidence answers are re-asked of the fallback provider, batched the same way
+        retry = [i for i in misses if self._needs_fallback(results[i])]
+        if retry:
+            retry_chunks = [retry[i:i + self.batch_size] for i in range(0, len(retry), self.batch_size)]
+            retry_analyses = await asyncio.gather(*(
+                self._call_provider(
+                    self._estimate_tokens([texts[i] for i in chunk]),
+                    self.fallback_provider.analyze_feedback_batch,
+                    [texts[i] for i in chunk]
+                )
+                for chunk in retry_chunks
+            ))
+            for chunk, chunk_results in zip(retry_chunks, retry_analyses):
+                for i, result in zip(chunk, chunk_results):
+                    results[i] = result
+        
+        for i in misses:
+            await self.cache.set(keys[i], results[i])
+        
+        return results
     
     def get_provider_name(self) -> str:
         """Get the name of the current LLM provider"""
         return self.provider.__class__.__name__.replace("Provider", "").lower()
+
+
+@lru_cache(maxsize=1)
+def get_llm_service() -> LLMService:
+    """Process-wide LLMService, so provider setup happens once rather than per request"""
+    return LLMService()
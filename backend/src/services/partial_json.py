@@ -0,0 +1,133 @@
+"""
+Incremental parser for flat JSON objects streamed in chunks
+"""
+from typing import Any, Dict, List, Optional
+import orjson
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_WHITESPACE = " \t\r\n"
+
+# Parser states
+_START, _KEY_OR_END, _KEY, _COLON, _VALUE, _STRING, _SCALAR, _AFTER_VALUE, _DONE = range(9)
+
+
+class PartialJSONObject:
+    """Parses one flat JSON object as it arrives, keeping state between chunks.
+
+    Every character is examined exactly once, so feeding a reply of n characters
+    costs O(n) in total however finely it is chunked. Completed members are in
+    `values`; a string value still being streamed is exposed via `partial_key`,
+    `partial_length` and `partial_value`. Nested objects and arrays are rejected.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.partial_key: Optional[str] = None
+        self.done = False
+
+        self._state = _START
+        self._key = None
+        self._chars: List[str] = []
+        self._escape = None  # None outside an escape, "" after a backslash, "u..." while reading hex
+
+    @property
+    def partial_length(self) -> int:
+        """Length of partial_value, without building the string"""
+        return len(self._chars) if self.partial_key is not None else 0
+
+    @property
+    def partial_value(self) -> str:
+        """Decoded text so far of the string value named by partial_key; joined on each access"""
+        return "".join(self._chars) if self.partial_key is not None else ""
+
+    def feed(self, chunk: str):
+        for ch in chunk:
+            self._step(ch)
+
+    def _step(self, ch: str):
+        state = self._state
+
+        if state == _STRING or state == _KEY:
+            self._string_char(ch)
+        elif state == _SCALAR:
+            if ch in _WHITESPACE or ch == "," or ch == "}":
+                self.values[self._key] = orjson.loads("".join(self._chars))
+                self._state = _AFTER_VALUE
+                self._step(ch)
+            else:
+                self._chars.append(ch)
+        elif ch in _WHITESPACE:
+            pass
+        elif state == _START:
+            # Anything before the opening brace (stray prose) is skipped
+            if ch == "{":
+                self._state = _KEY_OR_END
+        elif state == _KEY_OR_END:
+            if ch == '"':
+                self._chars = []
+                self._state = _KEY
+            elif ch == "}":
+                self._finish()
+            else:
+                raise ValueError(f"unexpected {ch!r} before object key")
+        elif state == _COLON:
+            if ch != ":":
+                raise ValueError(f"expected ':' after key, got {ch!r}")
+            self._state = _VALUE
+        elif state == _VALUE:
+            if ch == '"':
+                self._chars = []
+                self.partial_key = self._key
+                self._state = _STRING
+            elif ch == "{" or ch == "[":
+                raise ValueError("nested values are not supported")
+            else:
+                self._chars = [ch]
+                self._state = _SCALAR
+        elif state == _AFTER_VALUE:
+            if ch == ",":
+                self._state = _KEY_OR_END
+            elif ch == "}":
+                self._finish()
+            else:
+                raise ValueError(f"expected ',' or '}}' after value, got {ch!r}")
+
+    def _string_char(self, ch: str):
+        chars = self._chars
+        escape = self._escape
+
+        if escape is not None:
+            if escape == "":
+                if ch == "u":
+                    self._escape = "u"
+                    return
+                if ch not in _ESCAPES:
+                    raise ValueError(f"invalid escape \\{ch}")
+                chars.append(_ESCAPES[ch])
+                self._escape = None
+            else:
+                escape += ch
+                if len(escape) == 5:
+                    chars.append(chr(int(escape[1:], 16)))
+                    escape = None
+                self._escape = escape
+        elif ch == "\\":
+            self._escape = ""
+        elif ch == '"':
+            text = "".join(chars)
+            if any("\ud800" <= c <= "\udfff" for c in text):
+                # Recombine \u-escaped surrogate pairs
+                text = text.encode("utf-16", "surrogatepass").decode("utf-16")
+            if self._state == _KEY:
+                self._key = text
+                self._state = _COLON
+            else:
+                self.values[self._key] = text
+                self.partial_key = None
+                self._state = _AFTER_VALUE
+        else:
+            chars.append(ch)
+
+    def _finish(self):
+        self.done = True
+        self._state = _DONE
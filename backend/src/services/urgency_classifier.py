@@ -0,0 +1,151 @@
+"""
+Local urgency classifier for feedback whose category is already known
+"""
+import argparse
+import logging
+import math
+import os
+import random
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import orjson
+
+logger = logging.getLogger(__name__)
+
+URGENCY_LEVELS = (1, 2, 3, 4, 5)
+
+# feedback_history.llm_provider of rows the classifier answered itself
+URGENCY_CLASSIFIER_SOURCE = "urgency_classifier"
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _features(text: str, category: Optional[str]) -> List[int]:
+    """Hashed unigram and bigram features, plus the category itself"""
+    tokens = _TOKEN_RE.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    if category:
+        grams.append(f"category={category}")
+    # crc32 is stable across processes, unlike hash(), so saved models stay valid
+    return [zlib.crc32(gram.encode()) for gram in grams]
+
+
+class UrgencyClassifier:
+    """Multinomial logistic regression over hashed text features, with sparse weights"""
+
+    def __init__(self, n_features: int = 2 ** 18):
+        self.n_features = n_features
+        self.bias = [0.0] * len(URGENCY_LEVELS)
+        self.weights: Dict[int, List[float]] = {}
+
+    def _indices(self, text: str, category: Optional[str]) -> List[int]:
+        return [h % self.n_features for h in _features(text, category)]
+
+    def _scores(self, indices: Iterable[int]) -> List[float]:
+        scores = list(self.bias)
+        for index in indices:
+            row = self.weights.get(index)
+            if row is not None:
+                for k, w in enumerate(row):
+                    scores[k] += w
+        return scores
+
+    @staticmethod
+    def _softmax(scores: List[float]) -> List[float]:
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict_proba(self, text: str, category: Optional[str] = None) -> List[float]:
+        """Probability of each urgency level, in URGENCY_LEVELS order"""
+        return self._softmax(self._scores(self._indices(text, category)))
+
+    def predict(self, text: str, category: Optional[str] = None) -> Tuple[int, float]:
+        """Most likely urgency level and its probability"""
+        probs = self.predict_proba(text, category)
+        best = max(range(len(probs)), key=probs.__getitem__)
+        return URGENCY_LEVELS[best], probs[best]
+
+    def fit(self, samples: Sequence[Tuple[str, Optional[str], int]], epochs: int = 10,
+            learning_rate: float = 0.1, l2: float = 1e-4, seed: int = 0) -> "UrgencyClassifier":
+        """Train with SGD on (text, category, urgency_score) samples"""
+        rows = [(self._indices(text, category), URGENCY_LEVELS.index(urgency)) for text, category, urgency in samples]
+        rng = random.Random(seed)
+        classes = len(URGENCY_LEVELS)
+
+        for _ in range(epochs):
+            rng.shuffle(rows)
+            for indices, label in rows:
+                probs = self._softmax(self._scores(indices))
+                grads = [p - (1.0 if k == label else 0.0) for k, p in enumerate(probs)]
+                for k in range(classes):
+                    self.bias[k] -= learning_rate * grads[k]
+                for index in indices:
+                    row = self.weights.setdefault(index, [0.0] * classes)
+                    for k in range(classes):
+                        row[k] -= learning_rate * (grads[k] + l2 * row[k])
+        return self
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(orjson.dumps({
+                "n_features": self.n_features,
+                "bias": self.bias,
+                "weights": {str(index): row for index, row in self.weights.items()}
+            }))
+
+    @classmethod
+    def load(cls, path: str) -> "UrgencyClassifier":
+        with open(path, "rb") as f:
+            data = orjson.loads(f.read())
+        model = cls(data["n_features"])
+        model.bias = data["bias"]
+        model.weights = {int(index): row for index, row in data["weights"].items()}
+        return model
+
+
+def load_urgency_classifier() -> Optional[UrgencyClassifier]:
+    """Load the model named by URGENCY_MODEL_PATH; None leaves urgency to the LLM"""
+    path = os.getenv("URGENCY_MODEL_PATH")
+    if not path:
+        return None
+    try:
+        return UrgencyClassifier.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Urgency classifier not loaded from {path}: {e}")
+        return None
+
+
+def _history_samples(database_url: Optional[str] = None) -> List[Tuple[str, str, int]]:
+    """(text, category, urgency) pairs from past LLM analyses stored in feedback_history.
+
+    Rows the classifier answered itself are skipped, so a retrain never learns from its own predictions.
+    """
+    from sqlalchemy import create_engine, select
+    from models.database import SYNC_DATABASE_URL, FeedbackHistory
+
+    engine = create_engine(database_url or SYNC_DATABASE_URL)
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(select(
+                FeedbackHistory.feedback_text, FeedbackHistory.category, FeedbackHistory.urgency_score
+            ).where(
+                # Older rows may have no provider recorded; those are LLM answers
+                FeedbackHistory.llm_provider.is_distinct_from(URGENCY_CLASSIFIER_SOURCE)
+            )).all()
+    finally:
+        engine.dispose()
+    return [tuple(row) for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the urgency classifier from feedback history")
+    parser.add_argument("output", help="where to write the model JSON")
+    parser.add_argument("--epochs", type=int, default=10)
+    args = parser.parse_args()
+
+    samples = _history_samples()
+    UrgencyClassifier().fit(samples, epochs=args.epochs).save(args.output)
+    print(f"Trained on {len(samples)} samples, saved to {args.output}")
@@ -1,15 +1,106 @@
 """
 Enhanced input validation service
 """
+from __future__ import annotations
+
 import re
-from typing import List, Dict, Any
-from pydantic import validator
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import Any
 import html
+import string
+from ahocorasick_rs import BytesAhoCorasick
+
+
+# Fixed patterns used by the checks below, compiled once at import
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+_URL_RE = re.compile(r'https?://[^\s]+')
+_EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+
+
+# Character classes counted by _compute_stats
+_UPPER, _SPECIAL, _PUNCT, _SPECIAL_PUNCT = 1, 2, 3, 4
+
+
+def _char_class_table() -> bytes:
+    """bytes.translate table mapping every byte to its character class for _compute_stats.
+
+    All the classes are ASCII; UTF-8 multi-byte sequences are made of bytes >= 0x80,
+    which map to 0, so encoded non-ASCII text cannot produce false hits.
+    """
+    table = bytearray(256)
+    for ch in string.ascii_uppercase:
+        table[ord(ch)] = _UPPER
+    for ch in '<>"\'\\':
+        table[ord(ch)] = _SPECIAL
+    for ch in '.!?,:':
+        table[ord(ch)] = _PUNCT
+    table[ord(';')] = _SPECIAL_PUNCT  # the one character in both sets
+    return bytes(table)
+
+
+_CHAR_CLASSES = _char_class_table()
+
+# Null bytes and other control characters (all but tab, newline and carriage return), deleted by str.translate
+_CTRL_TABLE = dict.fromkeys([*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F])
+
+# The only lowercase characters re.IGNORECASE equates with ASCII letters; folding them lets the
+# case-sensitive literal scan and patterns match everything case-insensitive ones would
+_ASCII_CASE_FOLD = {0x131: 'i', 0x17F: 's'}
+
+
+# An Aho-Corasick automaton over distinct literals, and for each literal the indices of its patterns
+_LiteralScanner = tuple[BytesAhoCorasick, tuple[tuple[int, ...], ...]]
+
+
+def _build_automaton(literals: Sequence[Sequence[str]]) -> _LiteralScanner:
+    """One Aho-Corasick automaton over every pattern's literals; a hit yields the pattern indices"""
+    owners: dict[str, list[int]] = {}
+    for index, words in enumerate(literals):
+        for word in words:
+            owners.setdefault(word, []).append(index)
+    automaton = BytesAhoCorasick([word.encode() for word in owners])
+    return automaton, tuple(tuple(indices) for indices in owners.values())
+
+
+def _count_matching(scanner: _LiteralScanner, patterns: tuple[re.Pattern, ...],
+                    text_lower: str, limit: int) -> int:
+    """How many of `patterns` match, counting up to `limit`.
+
+    One linear literal scan finds the candidates; only patterns whose literals
+    occur are confirmed with their regex, each at most once. The literals are
+    ASCII, so the scan runs over UTF-8 bytes, which also tolerates lone surrogates.
+    """
+    folded = text_lower if text_lower.isascii() else text_lower.translate(_ASCII_CASE_FOLD)
+    automaton, owners = scanner
+    # Overlapping matches, or a literal sharing characters with an earlier hit
+    # ("delete" then "exec" in "deletexec") would go unreported
+    data = folded.encode('utf-8', 'surrogatepass')
+    found = {literal for literal, _, _ in automaton.find_matches_as_indexes(data, overlapping=True)}
+    checked = set()
+    matched = 0
+    for literal in found:
+        for index in owners[literal]:
+            if index in checked:
+                continue
+            checked.add(index)
+            if patterns[index].search(folded):
+                matched += 1
+                if matched >= limit:
+                    return matched
+    return matched
 
 
 class InputValidator:
     """Enhanced input validation with security and quality checks"""
     
+    # Instance settings live in slots; the patterns and automata below are shared class attributes
+    __slots__ = (
+        'min_length', 'max_length', 'max_repeated_chars', 'max_caps_percentage',
+        'return_warnings_on_error', '_validate_cached'
+    )
+    
     # Patterns for common attacks
     SQL_INJECTION_PATTERNS = [
         r"(union\s+select|drop\s+table|delete\s+from|insert\s+into)",
@@ -35,13 +126,36 @@ class InputValidator:
         r"(win\s+\$|make\s+money\s+fast)"
     ]
     
+    # Compiled once at import instead of going through the re cache per call. The patterns are
+    # lowercase and only ever searched in lowered, case-folded text, so no IGNORECASE is needed
+    _SQL_INJECTION_RES = tuple(re.compile(p) for p in SQL_INJECTION_PATTERNS)
+    _XSS_RES = tuple(re.compile(p) for p in XSS_PATTERNS)
+    _SPAM_RES = tuple(re.compile(p) for p in SPAM_PATTERNS)
+    
+    # Per pattern above, literals at least one of which every match contains
+    _SQL_INJECTION_LITERALS = (("union", "drop", "delete", "insert"), ("=",), ("exec",), ("script",))
+    _XSS_LITERALS = (("<script",), ("javascript:",), ("=",), ("<iframe",), ("eval",), ("alert",))
+    _SPAM_LITERALS = (
+        ("free", "click", "buy"),
+        ("viagra", "cialis", "casino", "poker"),
+        ("$$$", "!!!", ".........."),
+        ("win", "make")
+    )
+    _SQL_INJECTION_AC = _build_automaton(_SQL_INJECTION_LITERALS)
+    _XSS_AC = _build_automaton(_XSS_LITERALS)
+    _SPAM_AC = _build_automaton(_SPAM_LITERALS)
+    
     def __init__(self):
         self.min_length = 10
         self.max_length = 1000
         self.max_repeated_chars = 10
         self.max_caps_percentage = 70
+        # Rejected text skips the remaining checks unless every issue should be reported
+        self.return_warnings_on_error = False
+        # Identical submissions (retries, bots) reuse the first outcome; about 4 MB at the cap
+        self._validate_cached = lru_cache(maxsize=4096)(self._validate_impl)
     
-    def validate_feedback_text(self, text: str) -> Dict[str, Any]:
+    def validate_feedback_text(self, text: str) -> dict[str, Any]:
         """
         Comprehensive validation of feedback text
         Returns validation result with any issues found
@@ -54,6 +168,18 @@ class InputValidator:
                 "cleaned_text": ""
             }
         
+        cleaned_text, errors, warnings = self._validate_cached(
+            text, self.min_length, self.max_length, self.max_repeated_chars,
+            self.max_caps_percentage, self.return_warnings_on_error
+        )
+        return self._result(text, cleaned_text, list(errors), list(warnings))
+    
+    def _validate_impl(self, text: str, *settings: Any) -> tuple[str, tuple[str, ...], tuple[str, ...]]:
+        """Uncached validation, returning (cleaned_text, errors, warnings).
+
+        The settings arguments are unused here; they make the limits part of the
+        cache key, so changing one never serves a result computed under another.
+        """
         # Clean and normalize text
         cleaned_text = self._clean_text(text)
         
@@ -67,19 +193,34 @@ class InputValidator:
         if len(cleaned_text) > self.max_length:
             errors.append(f"Feedback must not exceed {self.max_length} characters")
         
+        if errors and not self.return_warnings_on_error:
+            return cleaned_text, tuple(errors), tuple(warnings)
+        
+        # Pattern checks all match against the lowercased text, so it is built once
+        text_lower = cleaned_text.lower()
+        
+        stats = self._compute_stats(cleaned_text)
+        
         # Security validation
-        security_issues = self._check_security(cleaned_text)
+        security_issues = self._check_security(cleaned_text, text_lower, stats)
         if security_issues:
             errors.extend(security_issues)
         
+        if errors and not self.return_warnings_on_error:
+            return cleaned_text, tuple(errors), tuple(warnings)
+        
         # Quality validation
-        quality_issues = self._check_quality(cleaned_text)
+        quality_issues = self._check_quality(cleaned_text, stats)
         warnings.extend(quality_issues)
         
         # Content validation
-        content_issues = self._check_content(cleaned_text)
+        content_issues = self._check_content(cleaned_text, text_lower)
         warnings.extend(content_issues)
         
+        return cleaned_text, tuple(errors), tuple(warnings)
+    
+    @staticmethod
+    def _result(text: str, cleaned_text: str, errors: list[str], warnings: list[str]) -> dict[str, Any]:
         return {
             "valid": len(errors) == 0,
             "errors": errors,
@@ -91,118 +232,142 @@ class InputValidator:
     
     def _clean_text(self, text: str) -> str:
         """Clean and normalize text input"""
-        # HTML decode
-        text = html.unescape(text)
+        # HTML decode; entities always start with '&'
+        if '&' in text:
+            text = html.unescape(text)
         
-        # Remove HTML tags (basic)
-        text = re.sub(r'<[^>]+>', '', text)
+        # Remove HTML tags (basic); most feedback has no '<' at all
+        if '<' in text:
+            text = _HTML_TAG_RE.sub('', text)
+        
+        # Printable text (the usual case, checked in one C pass) holds no whitespace besides
+        # ' ' and no control characters, so both regex passes below can usually be skipped
+        printable = text.isprintable()
         
         # Normalize whitespace
-        text = re.sub(r'\s+', ' ', text)
+        if not printable or '  ' in text:
+            text = _WS_RE.sub(' ', text)
         
         # Strip leading/trailing whitespace
         text = text.strip()
         
         # Remove null bytes and other control characters
-        text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)
+        if not printable:
+            text = text.translate(_CTRL_TABLE)
         
         return text
     
-    def _check_security(self, text: str) -> List[str]:
+    def _check_security(self, text: str, text_lower: str, stats: dict[str, Any]) -> list[str]:
         """Check for potential security issues"""
         issues = []
-        text_lower = text.lower()
         
         # Check for SQL injection patterns
-        for pattern in self.SQL_INJECTION_PATTERNS:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                issues.append("Text contains potentially malicious SQL patterns")
-                break
+        if _count_matching(self._SQL_INJECTION_AC, self._SQL_INJECTION_RES, text_lower, 1):
+            issues.append("Text contains potentially malicious SQL patterns")
         
         # Check for XSS patterns
-        for pattern in self.XSS_PATTERNS:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                issues.append("Text contains potentially malicious script content")
-                break
+        if _count_matching(self._XSS_AC, self._XSS_RES, text_lower, 1):
+            issues.append("Text contains potentially malicious script content")
         
         # Check for excessive special characters (potential injection)
-        special_char_ratio = len(re.findall(r'[<>"\';\\]', text)) / len(text) if text else 0
+        special_char_ratio = stats["special_count"] / len(text) if text else 0
         if special_char_ratio > 0.1:  # More than 10% special chars
             issues.append("Text contains excessive special characters")
         
         return issues
     
-    def _check_quality(self, text: str) -> List[str]:
+    def _compute_stats(self, text: str) -> dict[str, Any]:
+        """Character and word measurements shared by the security and quality checks and get_text_stats"""
+        # One C-level lookup-table pass classifies every byte; the counts are then C scans too
+        # surrogatepass: lone surrogates (valid in JSON strings) encode to high bytes instead of raising
+        classes = text.encode('utf-8', 'surrogatepass').translate(_CHAR_CLASSES)
+        if text.isascii():
+            # A-Z are the only uppercase ASCII characters
+            caps_count = classes.count(_UPPER)
+        else:
+            caps_count = sum(map(str.isupper, text))
+        return {
+            "caps_count": caps_count,
+            "special_count": classes.count(_SPECIAL) + classes.count(_SPECIAL_PUNCT),
+            "has_punctuation": _PUNCT in classes or _SPECIAL_PUNCT in classes,
+            "char_count": len(text),
+            "words": text.split()
+        }
+    
+    def _check_quality(self, text: str, stats: dict[str, Any]) -> list[str]:
         """Check text quality and provide warnings"""
         warnings = []
         
-        # Check for excessive repeated characters
-        repeated_chars = re.findall(r'(.)\1{' + str(self.max_repeated_chars) + ',}', text)
+        # Check for excessive repeated characters (runs longer than max_repeated_chars)
+        repeated_chars = set()
+        limit = self.max_repeated_chars
+        run_char = ''
+        run = 0
+        for c in text:
+            if c == run_char:
+                run += 1
+                if run > limit:
+                    repeated_chars.add(c)
+            else:
+                run_char = c
+                run = 1
         if repeated_chars:
-            warnings.append(f"Text contains excessive repeated characters: {''.join(set(repeated_chars))}")
+            warnings.append(f"Text contains excessive repeated characters: {''.join(repeated_chars)}")
         
         # Check for excessive capitalization
-        caps_count = sum(1 for c in text if c.isupper())
-        caps_percentage = (caps_count / len(text)) * 100 if text else 0
+        caps_percentage = (stats["caps_count"] / stats["char_count"]) * 100 if text else 0
         if caps_percentage > self.max_caps_percentage:
             warnings.append(f"Text contains excessive capitalization ({caps_percentage:.1f}%)")
         
         # Check for very short words (potential spam)
-        words = text.split()
+        words = stats["words"]
         if len(words) > 5:  # Only check if sufficient words
             short_words = [w for w in words if len(w) <= 2]
             if len(short_words) / len(words) > 0.5:
                 warnings.append("Text contains many very short words")
         
         # Check for lack of punctuation (potential spam)
-        has_punctuation = bool(re.search(r'[.!?,:;]', text))
-        if len(text) > 50 and not has_punctuation:
+        if len(text) > 50 and not stats["has_punctuation"]:
             warnings.append("Long text without punctuation may be unclear")
         
         return warnings
     
-    def _check_content(self, text: str) -> List[str]:
+    def _check_content(self, text: str, text_lower: str) -> list[str]:
         """Check content for spam or inappropriate patterns"""
         warnings = []
-        text_lower = text.lower()
         
         # Check for spam patterns
-        spam_matches = 0
-        for pattern in self.SPAM_PATTERNS:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                spam_matches += 1
+        spam_matches = _count_matching(self._SPAM_AC, self._SPAM_RES, text_lower, 2)
         
         if spam_matches >= 2:
             warnings.append("Text may contain spam-like content")
         
-        # Check for excessive URLs
-        url_pattern = r'https?://[^\s]+'
-        urls = re.findall(url_pattern, text)
-        if len(urls) > 2:
+        # Check for excessive URLs; the regexes only run when their literal is present
+        if '://' in text and len(_URL_RE.findall(text)) > 2:
             warnings.append("Text contains multiple URLs")
         
         # Check for email addresses (potential spam)
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        emails = re.findall(email_pattern, text)
-        if len(emails) > 1:
+        if '@' in text and len(_EMAIL_RE.findall(text)) > 1:
             warnings.append("Text contains multiple email addresses")
         
         return warnings
     
-    def get_text_stats(self, text: str) -> Dict[str, Any]:
+    def get_text_stats(self, text: str) -> dict[str, Any]:
         """Get statistics about the text"""
         if not text:
             return {"word_count": 0, "char_count": 0, "sentence_count": 0}
         
-        words = text.split()
-        sentences = re.split(r'[.!?]+', text)
+        stats = self._compute_stats(text)
+        words = stats["words"]
+        # Runs of terminators only add empty pieces, which the count skips like the blank ones
+        sentences = text.replace('!', '.').replace('?', '.').split('.')
         
         return {
             "word_count": len(words),
-            "char_count": len(text),
+            "char_count": stats["char_count"],
             "sentence_count": len([s for s in sentences if s.strip()]),
-            "avg_word_length": sum(len(word) for word in words) / len(words) if words else 0,
-            "caps_percentage": (sum(1 for c in text if c.isupper()) / len(text)) * 100 if text else 0
+            "avg_word_length": sum(map(len, words)) / len(words) if words else 0,
+            "caps_percentage": (stats["caps_count"] / stats["char_count"]) * 100
         }
 
 
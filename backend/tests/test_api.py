@@ -1,13 +1,59 @@
 import pytest
 import json
+from datetime import datetime, timedelta
 from unittest.mock import Mock, AsyncMock
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import NullPool
 from src.main import app
+from src.models.database import Base, FeedbackHistory, FeedbackStats
 from src.models.feedback import FeedbackCategory, UrgencyScore, LLMResponse
 from src.services.llm_service import LLMService
+# The app imports its modules from src/ directly; patch those, not the src.* copies
+from api import routes
 
 client = TestClient(app)
 
+
+@pytest.fixture
+def db_engine(tmp_path):
+    """Serve the API from a fresh SQLite database; yields a sync engine for seeding it"""
+    path = tmp_path / "api.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=sync_engine)
+    
+    # NullPool: TestClient may run each request on a different event loop
+    sessions = async_sessionmaker(
+        bind=create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool),
+        class_=AsyncSession,
+        expire_on_commit=False
+    )
+    
+    async def override_get_db():
+        async with sessions() as db:
+            yield db
+    
+    app.dependency_overrides[routes.get_db] = override_get_db
+    yield sync_engine
+    app.dependency_overrides.pop(routes.get_db, None)
+    sync_engine.dispose()
+
+
+def add_feedback(engine, *rows):
+    """Insert (id, created_at) feedback_history rows"""
+    with engine.begin() as conn:
+        conn.execute(FeedbackHistory.__table__.insert(), [
+            {
+                "id": row_id,
+                "feedback_text": f"Feedback {row_id}",
+                "category": "Bug Report",
+                "urgency_score": 4,
+                "created_at": created_at
+            }
+            for row_id, created_at in rows
+        ])
+
 class TestTriageAPI:
     
     def test_health_check(self):
@@ -69,6 +115,28 @@ class TestTriageAPI:
         response = client.post("/api/triage", json={})
         assert response.status_code == 422
     
+    def test_triage_blank_category(self, monkeypatch):
+        """Test that a whitespace-only category means no category was selected"""
+        service = Mock()
+        service.analyze_feedback = AsyncMock(return_value=LLMResponse(
+            category=FeedbackCategory.BUG_REPORT,
+            urgency_score=UrgencyScore.HIGH
+        ))
+        service.analyze_feedback_with_category = AsyncMock()
+        service.get_provider_name.return_value = "openai"
+        monkeypatch.setattr(routes, "get_llm_service", lambda: service)
+        monkeypatch.setattr(routes.feedback_writer, "submit", AsyncMock(return_value=1))
+        
+        response = client.post("/api/triage", json={
+            "text": "The app crashes when I save my work",
+            "category": "   "
+        })
+        
+        assert response.status_code == 200
+        assert response.json()["category"] == "Bug Report"
+        service.analyze_feedback.assert_awaited_once()
+        service.analyze_feedback_with_category.assert_not_called()
+    
     @pytest.mark.asyncio
     async def test_triage_llm_error(self, monkeypatch):
         """Test triage with LLM service error"""
@@ -83,3 +151,118 @@ class TestTriageAPI:
         
         assert response.status_code == 503
         assert "unavailable" in response.json()["detail"]
+
+
+class TestFeedbackHistoryAPI:
+    
+    @pytest.fixture
+    def history(self, db_engine):
+        """Five rows, newest first 5..1; rows 3 and 4 share a created_at"""
+        base = datetime(2024, 1, 1, 12, 0, 0)
+        add_feedback(
+            db_engine,
+            (1, base),
+            (2, base + timedelta(minutes=1)),
+            (3, base + timedelta(minutes=2)),
+            (4, base + timedelta(minutes=2)),
+            (5, base + timedelta(minutes=3))
+        )
+        return db_engine
+    
+    def test_first_page(self, history):
+        """Test that the first page holds the newest rows and a cursor to the next"""
+        response = client.get("/api/feedback/history", params={"limit": 2})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert [row["id"] for row in data["feedback"]] == [5, 4]
+        assert data["limit"] == 2
+        assert data["has_more"] is True
+        assert data["next_cursor"] == {"before": "2024-01-01T12:02:00", "before_id": 4}
+    
+    def test_follow_next_cursor(self, history):
+        """Test walking every page through next_cursor"""
+        params = {"limit": 2}
+        pages = []
+        while True:
+            data = client.get("/api/feedback/history", params=params).json()
+            pages.append([row["id"] for row in data["feedback"]])
+            if not data["has_more"]:
+                break
+            params = {"limit": 2, **data["next_cursor"]}
+        
+        # Row 3 shares row 4's created_at; the id tiebreak keeps it on the second page
+        assert pages == [[5, 4], [3, 2], [1]]
+    
+    def test_last_page(self, history):
+        """Test that the last page reports no further pages"""
+        response = client.get("/api/feedback/history", params={
+            "limit": 2, "before": "2024-01-01T12:01:00", "before_id": 2
+        })
+        
+        data = response.json()
+        assert [row["id"] for row in data["feedback"]] == [1]
+        assert data["has_more"] is False
+        assert data["next_cursor"] is None
+    
+    def test_exact_final_page(self, history):
+        """Test that a page ending on the last row does not report more"""
+        data = client.get("/api/feedback/history", params={"limit": 5}).json()
+        
+        assert len(data["feedback"]) == 5
+        assert data["has_more"] is False
+        assert data["next_cursor"] is None
+
+
+class TestDashboardAPI:
+    
+    @pytest.fixture
+    def dashboard_db(self, db_engine, monkeypatch):
+        """Seeded database, with an empty dashboard cache for each test"""
+        monkeypatch.setattr(routes, "_dashboard_cache", {"expires_at": 0.0, "payload": None, "etag": None})
+        add_feedback(db_engine, (1, datetime(2024, 1, 1, 12, 0, 0)))
+        with db_engine.begin() as conn:
+            conn.execute(FeedbackStats.__table__.insert(), [
+                {"category": "Bug Report", "urgency_score": 4, "cnt": 1, "sum_time": 0.5}
+            ])
+        return db_engine
+    
+    def test_dashboard(self, dashboard_db):
+        """Test dashboard aggregates and ETag"""
+        response = client.get("/api/dashboard")
+        
+        assert response.status_code == 200
+        assert response.headers["ETag"].startswith('W/"')
+        data = response.json()
+        assert data["total_feedback"] == 1
+        assert data["categories"] == {"Bug Report": 1}
+        assert [row["id"] for row in data["recent_feedback"]] == [1]
+    
+    def test_if_none_match_returns_304(self, dashboard_db):
+        """Test that a matching If-None-Match gets 304 with no body"""
+        etag = client.get("/api/dashboard").headers["ETag"]
+        
+        response = client.get("/api/dashboard", headers={"If-None-Match": etag})
+        
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+        
+        # A stale tag gets the full payload
+        response = client.get("/api/dashboard", headers={"If-None-Match": 'W/"stale"'})
+        assert response.status_code == 200
+    
+    def test_payload_cached_for_ttl(self, dashboard_db, monkeypatch):
+        """Test that the payload is reused within DASHBOARD_CACHE_TTL and rebuilt after it"""
+        first = client.get("/api/dashboard")
+        add_feedback(dashboard_db, (2, datetime(2024, 1, 1, 13, 0, 0)))
+        
+        cached = client.get("/api/dashboard")
+        assert cached.headers["ETag"] == first.headers["ETag"]
+        assert [row["id"] for row in cached.json()["recent_feedback"]] == [1]
+        
+        # Expire the entry
+        monkeypatch.setitem(routes._dashboard_cache, "expires_at", 0.0)
+        refreshed = client.get("/api/dashboard")
+        assert refreshed.headers["ETag"] != first.headers["ETag"]
+        assert [row["id"] for row in refreshed.json()["recent_feedback"]] == [2, 1]
@@ -0,0 +1,130 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import NullPool
+import src.services.feedback_writer as feedback_writer_module
+from src.services.feedback_writer import FeedbackWriter
+from src.models.database import Base, FeedbackHistory, FeedbackStats
+
+
+def make_record(i):
+    return {
+        "feedback_text": f"The app crashes on save ({i})",
+        "category": "Bug Report",
+        "urgency_score": 4,
+        "confidence_score": 0.9,
+        "processing_time": 0.5,
+        "llm_provider": "openai",
+        "user_ip": "127.0.0.1"
+    }
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Point the writer at a fresh SQLite database"""
+    path = tmp_path / "writer.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=sync_engine)
+    sync_engine.dispose()
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    monkeypatch.setattr(
+        feedback_writer_module, "SessionLocal",
+        async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    )
+    return path
+
+
+def read_rows(path, model):
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(model.__table__)).all()
+    finally:
+        engine.dispose()
+
+
+def record_batches(writer):
+    """Wrap writer._flush to record the size of every batch it writes"""
+    sizes = []
+    flush = writer._flush
+
+    async def spy(batch):
+        sizes.append(len(batch))
+        await flush(batch)
+
+    writer._flush = spy
+    return sizes
+
+
+class TestFeedbackWriter:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_submits_share_one_write(self, db_path):
+        """Test that records submitted together are committed in one batch"""
+        writer = FeedbackWriter(max_batch=100, flush_interval=0.05)
+        sizes = record_batches(writer)
+
+        ids = await asyncio.gather(*(writer.submit(make_record(i)) for i in range(5)))
+        await writer.stop()
+
+        assert sizes == [5]
+        assert len(set(ids)) == 5
+        assert len(read_rows(db_path, FeedbackHistory)) == 5
+        stats = read_rows(db_path, FeedbackStats)
+        assert [(row.category, row.urgency_score, row.cnt) for row in stats] == [("Bug Report", 4, 5)]
+
+    @pytest.mark.asyncio
+    async def test_batches_are_capped_at_max_batch(self, db_path):
+        """Test that a burst larger than max_batch is split into several writes"""
+        writer = FeedbackWriter(max_batch=2, flush_interval=0.05)
+        sizes = record_batches(writer)
+
+        await asyncio.gather(*(writer.submit(make_record(i)) for i in range(5)))
+        await writer.stop()
+
+        assert sizes == [2, 2, 1]
+
+    @pytest.mark.asyncio
+    async def test_flush_failure_reaches_every_waiter(self, db_path, monkeypatch):
+        """Test that a failed write raises in every caller of the batch"""
+        def broken_session():
+            raise RuntimeError("database unavailable")
+
+        monkeypatch.setattr(feedback_writer_module, "SessionLocal", broken_session)
+        writer = FeedbackWriter(max_batch=100, flush_interval=0.05)
+
+        results = await asyncio.gather(
+            *(writer.submit(make_record(i)) for i in range(3)), return_exceptions=True
+        )
+        await writer.stop()
+
+        assert len(results) == 3
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    @pytest.mark.asyncio
+    async def test_stop_writes_records_already_taken_from_queue(self, db_path):
+        """Test that stop() waits for the batch being collected instead of dropping it"""
+        writer = FeedbackWriter(max_batch=100, flush_interval=0.5)
+        tasks = [asyncio.create_task(writer.submit(make_record(i))) for i in range(3)]
+
+        # Let the flush task pull the records into its batch, then stop before the interval ends
+        await asyncio.sleep(0.05)
+        await writer.stop()
+
+        ids = await asyncio.wait_for(asyncio.gather(*tasks), 1)
+        assert len(set(ids)) == 3
+        assert len(read_rows(db_path, FeedbackHistory)) == 3
+
+    @pytest.mark.asyncio
+    async def test_cancelled_writer_fails_pending_records(self, db_path):
+        """Test that callers are not left waiting when the flush task is cancelled"""
+        writer = FeedbackWriter(max_batch=100, flush_interval=0.5)
+        tasks = [asyncio.create_task(writer.submit(make_record(i))) for i in range(2)]
+        await asyncio.sleep(0.05)
+
+        writer._task.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 1)
+
+        assert all(isinstance(result, RuntimeError) for result in results)
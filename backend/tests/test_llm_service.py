@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 import json
 from unittest.mock import Mock, AsyncMock, patch
@@ -6,10 +7,36 @@ from src.services.llm_service import (
     OpenAIProvider, 
     AnthropicProvider, 
     AzureOpenAIProvider,
-    GroqProvider
+    GroqProvider,
+    LocalLLMProvider,
+    RetryableHTTPError,
+    _SharedHTTP
 )
+from src.services.llm_cache import LLMResponseCache
 from src.models.feedback import FeedbackCategory, UrgencyScore, LLMResponse
 
+
+# Providers hold no per-test state, so each is built once for the module
+@pytest.fixture(scope="module")
+def openai_provider():
+    return OpenAIProvider("test-key")
+
+
+@pytest.fixture(scope="module")
+def anthropic_provider():
+    return AnthropicProvider("test-key")
+
+
+@pytest.fixture(scope="module")
+def azure_provider():
+    return AzureOpenAIProvider("test-key", "https://test.cognitiveservices.azure.com", "gpt-4o")
+
+
+@pytest.fixture(scope="module")
+def groq_provider():
+    return GroqProvider("test-key", "llama3-8b-8192")
+
+
 class TestLLMService:
     
     def test_init_with_openai_provider(self):
@@ -46,83 +73,230 @@ class TestLLMService:
         }):
             with pytest.raises(ValueError, match="Unsupported LLM provider"):
                 LLMService()
+    
+    @pytest.mark.asyncio
+    async def test_retries_transient_errors(self):
+        """Test that 429/5xx errors are retried, waiting at least the server's Retry-After"""
+        with patch.dict('os.environ', {
+            'DEFAULT_LLM_PROVIDER': 'openai',
+            'LLM_API_KEY': 'test-key',
+            'LLM_MAX_RETRIES': '2'
+        }):
+            service = LLMService()
+        
+        expected = LLMResponse(category=FeedbackCategory.BUG_REPORT, urgency_score=UrgencyScore.HIGH)
+        call = AsyncMock(side_effect=[RetryableHTTPError("OpenAI API error: 429", retry_after=7), expected])
+        
+        with patch('asyncio.sleep', AsyncMock()) as sleep:
+            assert await service._call_provider(1, call, "text") is expected
+            assert sleep.await_args.args[0] >= 7
+            
+            call = AsyncMock(side_effect=RetryableHTTPError("OpenAI API error: 503"))
+            with pytest.raises(RetryableHTTPError):
+                await service._call_provider(1, call, "text")
+            assert call.await_count == 3
+    
+    @pytest.mark.asyncio
+    async def test_warmup_is_one_bounded_attempt(self):
+        """Test that warmup is not retried and gives up after LLM_WARMUP_TIMEOUT"""
+        with patch.dict('os.environ', {
+            'DEFAULT_LLM_PROVIDER': 'openai',
+            'LLM_API_KEY': 'test-key',
+            'LLM_WARMUP_TIMEOUT': '0.01'
+        }):
+            service = LLMService()
+        
+        service.provider.warmup = AsyncMock(side_effect=RetryableHTTPError("OpenAI API error: 503"))
+        with pytest.raises(RetryableHTTPError):
+            await service.warmup()
+        assert service.provider.warmup.await_count == 1
+        
+        async def hang():
+            await asyncio.sleep(10)
+        
+        service.provider.warmup = hang
+        with pytest.raises(asyncio.TimeoutError):
+            await service.warmup()
+    
+    @pytest.mark.asyncio
+    async def test_retry_after_beyond_max_wait_is_not_retried(self):
+        """Test that a Retry-After longer than LLM_RETRY_MAX_WAIT fails at once"""
+        with patch.dict('os.environ', {
+            'DEFAULT_LLM_PROVIDER': 'openai',
+            'LLM_API_KEY': 'test-key',
+            'LLM_RETRY_MAX_WAIT': '30'
+        }):
+            service = LLMService()
+        
+        call = AsyncMock(side_effect=RetryableHTTPError("OpenAI API error: 429", retry_after=86400))
+        with patch('asyncio.sleep', AsyncMock()) as sleep:
+            with pytest.raises(RetryableHTTPError):
+                await service._call_provider(1, call, "text")
+            sleep.assert_not_awaited()
+        assert call.await_count == 1
 
 class TestOpenAIProvider:
     
-    def test_create_prompt(self):
+    def test_create_prompt(self, openai_provider):
         """Test prompt creation"""
-        provider = OpenAIProvider("test-key")
-        prompt = provider._create_prompt("Test feedback")
+        prompt = openai_provider._create_prompt("Test feedback")
         assert "Test feedback" in prompt
         assert "Bug Report" in prompt
         assert "urgency_score" in prompt
     
+    def test_to_response(self, openai_provider):
+        """Test that well-formed replies map straight onto the enums"""
+        result = openai_provider._to_response({
+            "category": "Bug Report", "urgency_score": 4, "reasoning": "x", "confidence_score": 0.9
+        })
+        assert result.category == FeedbackCategory.BUG_REPORT
+        assert result.urgency_score == UrgencyScore.HIGH
+        assert result.confidence_score == 0.9
+    
+    def test_to_response_validates_loose_values(self, openai_provider):
+        """Test that values off the exact-type fast path get full validation"""
+        # Fractional scores are rejected rather than truncated
+        with pytest.raises(ValueError):
+            openai_provider._to_response({"category": "Bug Report", "urgency_score": 4.7})
+        with pytest.raises(ValueError):
+            openai_provider._to_response({"category": "Bug Report", "urgency_score": "4"})
+        
+        # A bool confidence is coerced by the model instead of passed through
+        result = openai_provider._to_response({
+            "category": "Bug Report", "urgency_score": 4, "reasoning": "x", "confidence_score": True
+        })
+        assert result.urgency_score == UrgencyScore.HIGH
+        assert type(result.confidence_score) is float
+    
     @pytest.mark.asyncio
-    async def test_analyze_feedback_success(self):
+    async def test_analyze_feedback_success(self, openai_provider):
         """Test successful feedback analysis"""
-        provider = OpenAIProvider("test-key")
-        
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_response.content = json.dumps({
             "choices": [{
                 "message": {
                     "content": '{"category": "Bug Report", "urgency_score": 4, "reasoning": "Login issue"}'
                 }
             }]
-        }
+        }).encode()
+        
+        mock_client = AsyncMock()
+        mock_client.post.return_value = mock_response
         
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.post.return_value = mock_response
+        with patch.object(_SharedHTTP, 'get', AsyncMock(return_value=mock_client)):
             
-            result = await provider.analyze_feedback("I can't log in")
+            result = await openai_provider.analyze_feedback("I can't log in")
             
             assert result.category == FeedbackCategory.BUG_REPORT
             assert result.urgency_score == UrgencyScore.HIGH
             assert result.reasoning == "Login issue"
     
     @pytest.mark.asyncio
-    async def test_analyze_feedback_api_error(self):
+    async def test_analyze_feedback_api_error(self, openai_provider):
         """Test API error handling"""
-        provider = OpenAIProvider("test-key")
-        
         mock_response = Mock()
         mock_response.status_code = 500
         mock_response.text = "Internal Server Error"
         
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.post.return_value = mock_response
+        mock_client = AsyncMock()
+        mock_client.post.return_value = mock_response
+        
+        with patch.object(_SharedHTTP, 'get', AsyncMock(return_value=mock_client)):
             
             with pytest.raises(Exception, match="OpenAI API error"):
-                await provider.analyze_feedback("Test feedback")
+                await openai_provider.analyze_feedback("Test feedback")
+
+    @pytest.mark.asyncio
+    async def test_analyze_feedback_batch(self, openai_provider):
+        """Test that a batch is sent as one request and mapped back in order"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.content = json.dumps({
+            "choices": [{
+                "message": {
+                    "content": '[{"category": "Bug Report", "urgency_score": 4, "reasoning": "Login issue"}, '
+                               '{"category": "Feature Request", "urgency_score": 2, "reasoning": "Enhancement"}]'
+                }
+            }]
+        }).encode()
+        
+        mock_client = AsyncMock()
+        mock_client.post.return_value = mock_response
+        
+        with patch.object(_SharedHTTP, 'get', AsyncMock(return_value=mock_client)):
+            results = await openai_provider.analyze_feedback_batch(["I can't log in", "Add dark mode please"])
+            
+            assert mock_client.post.call_count == 1
+            assert [r.category for r in results] == [FeedbackCategory.BUG_REPORT, FeedbackCategory.FEATURE_REQUEST]
+            assert [r.urgency_score for r in results] == [UrgencyScore.HIGH, UrgencyScore.LOW]
+            
+            with pytest.raises(Exception, match="Failed to parse LLM response"):
+                await openai_provider.analyze_feedback_batch(["only", "three", "items"])
+
+    @pytest.mark.asyncio
+    async def test_analyze_feedback_stream(self, openai_provider):
+        """Test that category and urgency are yielded before the reasoning has finished"""
+        
+        reply = '{"category": "Bug Report", "urgency_score": 4, "reasoning": "Login \\"issue\\"", "confidence_score": 0.9}'
+        pieces = [reply[i:i + 7] for i in range(0, len(reply), 7)]
+        
+        async def aiter_lines():
+            for piece in pieces:
+                yield "data: " + json.dumps({"choices": [{"delta": {"content": piece}}]})
+                yield ""
+            yield "data: [DONE]"
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.aiter_lines = aiter_lines
+        
+        mock_client = Mock()
+        mock_client.stream.return_value.__aenter__ = AsyncMock(return_value=mock_response)
+        mock_client.stream.return_value.__aexit__ = AsyncMock(return_value=False)
+        
+        with patch.object(_SharedHTTP, 'get', AsyncMock(return_value=mock_client)):
+            partials = [p async for p in openai_provider.analyze_feedback_stream("I can't log in")]
+        
+        first_classified = next(p for p in partials if p.urgency_score is not None)
+        assert first_classified.category == FeedbackCategory.BUG_REPORT
+        assert first_classified.urgency_score == UrgencyScore.HIGH
+        assert not first_classified.complete
+        assert any(p.reasoning and not p.complete and 'Login "issue"'.startswith(p.reasoning) for p in partials)
+        
+        final = partials[-1]
+        assert final.complete
+        assert final.reasoning == 'Login "issue"'
+        assert final.confidence_score == 0.9
+        assert json.loads(mock_client.stream.call_args.kwargs["content"])["stream"] is True
 
 class TestAnthropicProvider:
     
-    def test_create_prompt(self):
+    def test_create_prompt(self, anthropic_provider):
         """Test prompt creation"""
-        provider = AnthropicProvider("test-key")
-        prompt = provider._create_prompt("Test feedback")
+        prompt = anthropic_provider._create_prompt("Test feedback")
         assert "Test feedback" in prompt
         assert "Bug Report" in prompt
         assert "urgency_score" in prompt
     
     @pytest.mark.asyncio
-    async def test_analyze_feedback_success(self):
+    async def test_analyze_feedback_success(self, anthropic_provider):
         """Test successful feedback analysis"""
-        provider = AnthropicProvider("test-key")
-        
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_response.content = json.dumps({
             "content": [{
-                "text": '{"category": "Feature Request", "urgency_score": 2, "reasoning": "Enhancement request"}'
+                "type": "tool_use",
+                "name": "emit_feedback",
+                "input": {"category": "Feature Request", "urgency_score": 2, "reasoning": "Enhancement request"}
             }]
-        }
+        }).encode()
+        
+        mock_client = AsyncMock()
+        mock_client.post.return_value = mock_response
         
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.post.return_value = mock_response
+        with patch.object(_SharedHTTP, 'get', AsyncMock(return_value=mock_client)):
             
-            result = await provider.analyze_feedback("Add dark mode please")
+            result = await anthropic_provider.analyze_feedback("Add dark mode please")
             
             assert result.category == FeedbackCategory.FEATURE_REQUEST
             assert result.urgency_score == UrgencyScore.LOW
@@ -131,41 +305,32 @@ class TestAnthropicProvider:
 
 class TestAzureOpenAIProvider:
     
-    def test_create_prompt(self):
+    def test_create_prompt(self, azure_provider):
         """Test prompt creation"""
-        provider = AzureOpenAIProvider(
-            "test-key", 
-            "https://test.cognitiveservices.azure.com", 
-            "gpt-4o"
-        )
-        prompt = provider._create_prompt("Test feedback")
+        prompt = azure_provider._create_prompt("Test feedback")
         assert "Test feedback" in prompt
         assert "Bug Report" in prompt
         assert "urgency_score" in prompt
     
     @pytest.mark.asyncio
-    async def test_analyze_feedback_success(self):
+    async def test_analyze_feedback_success(self, azure_provider):
         """Test successful feedback analysis"""
-        provider = AzureOpenAIProvider(
-            "test-key", 
-            "https://test.cognitiveservices.azure.com", 
-            "gpt-4o"
-        )
-        
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_response.content = json.dumps({
             "choices": [{
                 "message": {
                     "content": '{"category": "Bug Report", "urgency_score": 5, "reasoning": "Critical login issue"}'
                 }
             }]
-        }
+        }).encode()
+        
+        mock_client = AsyncMock()
+        mock_client.post.return_value = mock_response
         
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.post.return_value = mock_response
+        with patch.object(_SharedHTTP, 'get', AsyncMock(return_value=mock_client)):
             
-            result = await provider.analyze_feedback("System is down!")
+            result = await azure_provider.analyze_feedback("System is down!")
             
             assert result.category == FeedbackCategory.BUG_REPORT
             assert result.urgency_score == UrgencyScore.CRITICAL
@@ -174,33 +339,32 @@ class TestAzureOpenAIProvider:
 
 class TestGroqProvider:
     
-    def test_create_prompt(self):
+    def test_create_prompt(self, groq_provider):
         """Test prompt creation"""
-        provider = GroqProvider("test-key", "llama3-8b-8192")
-        prompt = provider._create_prompt("Test feedback")
+        prompt = groq_provider._create_prompt("Test feedback")
         assert "Test feedback" in prompt
         assert "Bug Report" in prompt
         assert "urgency_score" in prompt
     
     @pytest.mark.asyncio
-    async def test_analyze_feedback_success(self):
+    async def test_analyze_feedback_success(self, groq_provider):
         """Test successful feedback analysis"""
-        provider = GroqProvider("test-key", "llama3-8b-8192")
-        
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_response.content = json.dumps({
             "choices": [{
                 "message": {
                     "content": '{"category": "Praise/Positive Feedback", "urgency_score": 1, "reasoning": "Positive user feedback"}'
                 }
             }]
-        }
+        }).encode()
         
-        with patch('httpx.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.post.return_value = mock_response
+        mock_client = AsyncMock()
+        mock_client.post.return_value = mock_response
+        
+        with patch.object(_SharedHTTP, 'get', AsyncMock(return_value=mock_client)):
             
-            result = await provider.analyze_feedback("Great app, love using it!")
+            result = await groq_provider.analyze_feedback("Great app, love using it!")
             
             assert result.category == FeedbackCategory.PRAISE_POSITIVE_FEEDBACK
             assert result.urgency_score == UrgencyScore.NOT_URGENT
@@ -244,3 +408,77 @@ class TestLLMServiceWithNewProviders:
         }, clear=True):
             with pytest.raises(ValueError, match="GROQ_API_KEY"):
                 LLMService()
+    
+    def test_init_with_local_provider(self):
+        """Test LLMService initialization with a local OpenAI-compatible server"""
+        with patch.dict('os.environ', {
+            'DEFAULT_LLM_PROVIDER': 'local',
+            'LOCAL_LLM_URL': 'http://gpu-box:8000/v1/'
+        }, clear=True):
+            service = LLMService()
+            assert isinstance(service.provider, LocalLLMProvider)
+            assert service.provider.url == "http://gpu-box:8000/v1/chat/completions"
+            assert service.fallback_provider is None
+    
+    @pytest.mark.asyncio
+    async def test_urgency_classifier_answers_are_marked(self):
+        """Test that a confident classifier answer skips the LLM and names its source"""
+        with patch.dict('os.environ', {
+            'DEFAULT_LLM_PROVIDER': 'openai',
+            'LLM_API_KEY': 'test-key'
+        }):
+            service = LLMService()
+        
+        service.urgency_classifier = Mock()
+        service.urgency_classifier.predict.return_value = (5, 0.95)
+        service.provider.analyze_feedback_with_category = AsyncMock()
+        
+        result = await service.analyze_feedback_with_category("Site is down for everyone", "Bug Report")
+        
+        assert result.urgency_score == UrgencyScore.CRITICAL
+        assert result.source == "urgency_classifier"
+        service.provider.analyze_feedback_with_category.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_low_confidence_uses_fallback_provider(self):
+        """Test that a low-confidence local answer is replaced by the fallback provider's"""
+        with patch.dict('os.environ', {
+            'DEFAULT_LLM_PROVIDER': 'local',
+            'LLM_FALLBACK_PROVIDER': 'openai',
+            'LLM_API_KEY': 'test-key'
+        }, clear=True):
+            service = LLMService()
+        assert isinstance(service.fallback_provider, OpenAIProvider)
+        
+        unsure = LLMResponse(category=FeedbackCategory.GENERAL_INQUIRY, urgency_score=UrgencyScore.LOW, confidence_score=0.4)
+        sure = LLMResponse(category=FeedbackCategory.BUG_REPORT, urgency_score=UrgencyScore.HIGH, confidence_score=0.9)
+        
+        with patch.object(service.provider, 'analyze_feedback', AsyncMock(return_value=unsure)), \
+             patch.object(service.fallback_provider, 'analyze_feedback', AsyncMock(return_value=sure)) as fallback:
+            assert await service.analyze_feedback("Checkout fails with error 500") == sure
+            fallback.assert_awaited_once()
+
+
+class TestLLMResponseCache:
+    
+    def test_make_key_normalizes_text(self):
+        """Test that case and surrounding whitespace do not change the key"""
+        key = LLMResponseCache.make_key("groq", "llama3-8b-8192", None, "App crashes")
+        assert key == LLMResponseCache.make_key("groq", "llama3-8b-8192", None, "  app CRASHES ")
+        assert key != LLMResponseCache.make_key("groq", "llama3-8b-8192", "Bug Report", "App crashes")
+    
+    @pytest.mark.asyncio
+    async def test_get_set_and_eviction(self):
+        """Test LRU round-trip and eviction"""
+        cache = LLMResponseCache(maxsize=1)
+        cache.redis = None
+        response = LLMResponse(category=FeedbackCategory.BUG_REPORT, urgency_score=UrgencyScore.HIGH, reasoning="Login issue")
+        
+        await cache.set("a", response)
+        cached = await cache.get("a")
+        assert cached.category == "Bug Report"
+        assert cached.urgency_score == 4
+        assert cached.reasoning == "Login issue"
+        
+        await cache.set("b", response)
+        assert await cache.get("a") is None
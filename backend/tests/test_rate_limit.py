@@ -0,0 +1,158 @@
+import pytest
+import redis.asyncio as redis
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import src.middleware.rate_limit as rate_limit_module
+from src.middleware.rate_limit import RateLimitMiddleware
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio for the INCR + EXPIRE pipeline; workers can share `counts`"""
+
+    def __init__(self, counts=None, down=False):
+        self.counts = {} if counts is None else counts
+        self.expiries = {}
+        self.down = down
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+
+    def __init__(self, store):
+        self.store = store
+        self.commands = []
+
+    def incr(self, key):
+        self.commands.append(("incr", key))
+
+    def expire(self, key, seconds):
+        self.commands.append(("expire", key, seconds))
+
+    async def execute(self):
+        if self.store.down:
+            raise redis.ConnectionError("Connection refused")
+        results = []
+        for command in self.commands:
+            if command[0] == "incr":
+                self.store.counts[command[1]] = self.store.counts.get(command[1], 0) + 1
+                results.append(self.store.counts[command[1]])
+            else:
+                self.store.expiries[command[1]] = command[2]
+                results.append(True)
+        return results
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.time() for the limiter; advance by assigning clock.now"""
+    class Clock:
+        now = 1000.0
+
+    monkeypatch.setattr(rate_limit_module.time, "time", lambda: Clock.now)
+    return Clock
+
+
+def make_limiter(calls=2, period=60, redis_client=None):
+    limiter = RateLimitMiddleware(None, calls=calls, period=period)
+    limiter.redis = redis_client
+    return limiter
+
+
+class TestRateLimitMiddleware:
+
+    def test_over_limit_returns_429(self):
+        """Test that requests past the limit get a 429 with Retry-After"""
+        app = FastAPI()
+
+        @app.get("/api/triage")
+        async def triage():
+            return {"ok": True}
+
+        app.add_middleware(RateLimitMiddleware, calls=2, period=60)
+        client = TestClient(app)
+
+        assert [client.get("/api/triage").status_code for _ in range(3)] == [200, 200, 429]
+        response = client.get("/api/triage")
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "60"
+        assert response.json()["detail"]["error"] == "Rate limit exceeded"
+
+    @pytest.mark.asyncio
+    async def test_redis_counter_is_shared_across_workers(self):
+        """Test that two workers count against one Redis window"""
+        counts = {}
+        first = make_limiter(redis_client=FakeRedis(counts))
+        second = make_limiter(redis_client=FakeRedis(counts))
+
+        assert await first._is_allowed("1.2.3.4")
+        assert await second._is_allowed("1.2.3.4")
+        assert not await first._is_allowed("1.2.3.4")
+        assert await second._is_allowed("5.6.7.8")
+
+        # Window keys expire on their own, and the local store is never touched
+        assert set(first.redis.expiries.values()) == {60}
+        assert not first.requests and not second.requests
+
+    @pytest.mark.asyncio
+    async def test_redis_down_falls_back_to_local_limits(self):
+        """Test that Redis errors fall back to in-process limits and back off from Redis"""
+        store = FakeRedis(down=True)
+        limiter = make_limiter(redis_client=store)
+
+        assert await limiter._is_allowed("1.2.3.4")
+        assert await limiter._is_allowed("1.2.3.4")
+        assert not await limiter._is_allowed("1.2.3.4")
+        assert len(limiter.requests["1.2.3.4"]) == 2
+
+        # Redis is skipped until the retry interval passes, even once it is back
+        store.down = False
+        assert not await limiter._is_allowed("1.2.3.4")
+        assert not store.counts
+
+    def test_redis_client_has_short_timeouts(self, monkeypatch):
+        """Test that an unreachable Redis cannot stall requests for the OS TCP timeout"""
+        monkeypatch.setenv("REDIS_URL", "redis://localhost:6379/0")
+        monkeypatch.setenv("RATE_LIMIT_REDIS_TIMEOUT", "0.1")
+        limiter = RateLimitMiddleware(None)
+
+        kwargs = limiter.redis.connection_pool.connection_kwargs
+        assert kwargs["socket_connect_timeout"] == 0.1
+        assert kwargs["socket_timeout"] == 0.1
+
+    def test_full_buffer_is_rejected(self, clock):
+        """Test that a client with `calls` requests inside the window is refused"""
+        limiter = make_limiter(calls=3, period=60)
+
+        assert [limiter._is_allowed_local("1.2.3.4") for _ in range(4)] == [True, True, True, False]
+        # Refused requests are not recorded, and other clients are unaffected
+        assert len(limiter.requests["1.2.3.4"]) == 3
+        assert limiter._is_allowed_local("5.6.7.8")
+
+    def test_entries_expire_after_period(self, clock):
+        """Test that capacity comes back as the oldest entries leave the window"""
+        limiter = make_limiter(calls=2, period=60)
+
+        assert limiter._is_allowed_local("1.2.3.4")
+        clock.now += 30
+        assert limiter._is_allowed_local("1.2.3.4")
+        assert not limiter._is_allowed_local("1.2.3.4")
+
+        # The first entry has left the window; the second has not
+        clock.now += 31
+        assert limiter._is_allowed_local("1.2.3.4")
+        assert not limiter._is_allowed_local("1.2.3.4")
+
+    def test_idle_clients_are_swept(self, clock):
+        """Test that clients idle for a whole period are dropped on the next check"""
+        limiter = make_limiter(calls=2, period=60)
+
+        limiter._is_allowed_local("1.2.3.4")
+        clock.now += 45
+        limiter._is_allowed_local("5.6.7.8")
+
+        # 1.2.3.4 has been idle past the period and 5.6.7.8 has not
+        clock.now += 20
+        limiter._is_allowed_local("9.9.9.9")
+        assert set(limiter.requests) == {"5.6.7.8", "9.9.9.9"}
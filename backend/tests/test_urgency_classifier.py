@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import create_engine
+from src.models.database import Base, FeedbackHistory
+from src.services.urgency_classifier import URGENCY_CLASSIFIER_SOURCE, UrgencyClassifier, _history_samples
+
+
+@pytest.fixture
+def classifier():
+    samples = [
+        ("The app crashes and I lost all my work", "Bug Report", 5),
+        ("Site is down for everyone, urgent", "Bug Report", 5),
+        ("Love the new design, thanks", "Praise/Positive Feedback", 1),
+        ("Great app, nice work", "Praise/Positive Feedback", 1),
+    ] * 20
+    return UrgencyClassifier(n_features=2 ** 12).fit(samples, epochs=5)
+
+
+class TestUrgencyClassifier:
+
+    def test_predict(self, classifier):
+        """Test that trained examples are recovered with high probability"""
+        urgency, probability = classifier.predict("the app crashes and I lost my work", "Bug Report")
+        assert urgency == 5
+        assert probability > 0.7
+
+        urgency, _ = classifier.predict("love the design, thanks", "Praise/Positive Feedback")
+        assert urgency == 1
+
+    def test_predict_proba_sums_to_one(self, classifier):
+        """Test probabilities over the five urgency levels"""
+        probs = classifier.predict_proba("something unrelated")
+        assert len(probs) == 5
+        assert sum(probs) == pytest.approx(1.0)
+
+    def test_save_and_load(self, classifier, tmp_path):
+        """Test that a saved model predicts identically after loading"""
+        path = str(tmp_path / "urgency.json")
+        classifier.save(path)
+        loaded = UrgencyClassifier.load(path)
+        text = "Site is down, urgent"
+        assert loaded.predict_proba(text, "Bug Report") == pytest.approx(classifier.predict_proba(text, "Bug Report"))
+
+    def test_history_samples_skip_own_predictions(self, tmp_path):
+        """Test that training data leaves out rows the classifier answered itself"""
+        url = f"sqlite:///{tmp_path / 'history.db'}"
+        engine = create_engine(url)
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(FeedbackHistory.__table__.insert(), [
+                {"feedback_text": "from the llm", "category": "Bug Report", "urgency_score": 5, "llm_provider": "openai"},
+                {"feedback_text": "from before providers were recorded", "category": "Bug Report", "urgency_score": 4, "llm_provider": None},
+                {"feedback_text": "from the classifier", "category": "Bug Report", "urgency_score": 3,
+                 "llm_provider": URGENCY_CLASSIFIER_SOURCE},
+            ])
+        engine.dispose()
+
+        texts = sorted(text for text, _, _ in _history_samples(url))
+        assert texts == ["from before providers were recorded", "from the llm"]